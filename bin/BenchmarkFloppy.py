@@ -0,0 +1,5 @@
+#!python3
+if __name__ == '__main__':
+    import sys
+    import floppy.benchmark
+    sys.exit(floppy.benchmark.main())
@@ -3,8 +3,9 @@
 # from lauescript.cryst.iterators import iter_atom_pairs
 from lauescript.cryst.transformations import frac2cart
 from lauescript.types.adp import ADPDataError
-from floppy.node import Node, abstractNode, Input, Output, Tag, ForLoop
+from floppy.node import Node, abstractNode, Input, Output, Tag, Resource, ForLoop
 from floppy.FloppyTypes import Atom
+import floppy.cache
 import subprocess
 import os
 
@@ -64,6 +65,8 @@ class Frac2Cart(CrystNode):
     Input('Position', float, list=True)
     Input('Cell', float, list=True)
     Output('Cart', float, list=True)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(Frac2Cart, self).run()
@@ -94,6 +97,9 @@ class PDB2INS(CrystNode):
     Output('INS', str)
     Output('HKL', str)
     Output('PDB', str)
+    # Pdb2ins runs write to __pdb2ins__.* in the working directory.
+    Resource('pdb2ins', 1)
+    diskCacheable = True
 
     def __init__(self, *args, **kwargs):
         super(PDB2INS, self).__init__(*args, **kwargs)
@@ -103,6 +109,17 @@ class PDB2INS(CrystNode):
         x = self.inputs['FileName'].isAvailable()
         return x
 
+    def toolVersion(self):
+        return floppy.cache.programVersion('pdb2ins')
+
+    def cacheKey(self):
+        # The input is a file name. Include the state of the files read by pdb2ins in the key.
+        fileName = self.inputs['FileName'](True)
+        if not fileName:
+            return None
+        stamps = [floppy.cache.fileStamp(name) for name in (fileName, fileName + '.sf', fileName + '.hkl')]
+        return floppy.cache.hashValues(super(PDB2INS, self).cacheKey(), stamps)
+
     def run(self):
         super(PDB2INS, self).run()
         opt =  ('pdb2ins',
@@ -122,7 +139,7 @@ class PDB2INS(CrystNode):
         print(opt)
         # opt = [o for o in ' '.join(opt).split(' ') if o]
         # print(opt)
-        self.p = subprocess.Popen(opt, shell=True, stdout=subprocess.PIPE)
+        self.p = self.popen(opt, shell=True, stdout=subprocess.PIPE)
         self.stdout = ''
         while True:
             line = self.p.stdout.readline()
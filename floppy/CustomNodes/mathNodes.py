@@ -10,6 +10,8 @@ def norm(v: list):
 @abstractNode
 class MathNode(Node):
     Tag('Math')
+    stateless = True
+    cacheable = True
 
 
 class Add(MathNode):
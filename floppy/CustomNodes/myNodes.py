@@ -3,6 +3,7 @@ from floppy.FloppyTypes import StructureInfo, Atom
 import time
 import random
 import subprocess
+import asyncio
 
 class AMyNode(Node):
     Input('Inta', int)
@@ -24,7 +25,7 @@ class FakeWorkNode(Node):
 
     def run(self):
         print('Working @ {}'.format(str(self._inp)))
-        time.sleep(random.randrange(1,5))
+        self.sleep(random.randrange(1,5))
         print('Done')
         # self._return('Test Return Value')
 
@@ -57,15 +58,14 @@ class RunProgram(Node):
     Output('ReturnValue', int)
     Output('StdOut', str)
 
-    def run(self):
+    async def run(self):
         programName = self._ProgramName
         args = [programName] + self._Arguments.split()
-        r = 0
-        try:
-            out = subprocess.check_output(args, shell=True)
-        except subprocess.CalledProcessError as e:
+        p = await self.popenAsync(' '.join(args), shell=True, stdout=subprocess.PIPE)
+        out, err = await p.communicate()
+        r = p.returncode
+        if r:
             out = ''
-            r = e[-1]
         self._ReturnValue(r)
         self._StdOut(out)
 
@@ -99,6 +99,7 @@ class Int2Str(Node):
 class PlotNode2(Node):
     Input('XX', str)
     Output('YY', str)
+    polled = True
 
     def __init__(self, *args, **kwargs):
         super(PlotNode2, self).__init__(*args, **kwargs)
@@ -1,5 +1,6 @@
-from floppy.node import Node, Input, Output, Tag, abstractNode
+from floppy.node import Node, Input, Output, Tag, Resource, abstractNode
 from floppy.CustomNodes.crystNodes import CrystNode
+import floppy.cache
 import subprocess
 import os
 
@@ -19,12 +20,18 @@ class RunShelxl(ShelxNode):
     Output('LST', str)
     Output('FCF', str)
     Output('R1', float)
+    # Shelxl runs write to __tmp__.* in the working directory.
+    Resource('shelxl', 1)
+    diskCacheable = True
 
     def __init__(self, *args, **kwargs):
         super(RunShelxl, self).__init__(*args, **kwargs)
         self.p = None
         self.stdout = ''
 
+    def toolVersion(self):
+        return floppy.cache.programVersion('shelxl')
+
     def run(self):
         super(RunShelxl, self).run()
         with open('__tmp__.ins', 'w') as fp:
@@ -32,7 +39,7 @@ class RunShelxl(ShelxNode):
         with open('__tmp__.hkl', 'w') as fp:
             fp.write(self._HKL)
 
-        self.p = subprocess.Popen('shelxl {}'.format('__tmp__'), shell=True, stdout=subprocess.PIPE)
+        self.p = self.popen('shelxl {}'.format('__tmp__'), shell=True, stdout=subprocess.PIPE)
         while True:
             line = self.p.stdout.readline()
             if not line:
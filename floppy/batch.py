@@ -0,0 +1,201 @@
+"""
+Module implementing a headless executor for stored graphs.
+Graphs are loaded with Graph.load() and executed by the same ExecutionThread used by the graph interpreter. No PyQt
+module is imported. Several graphs can be executed at once in a pool of worker processes. The return values and
+timings of all graphs are reported as JSON.
+
+Usage:
+    python BatchFloppy.py -p 4 -m Parallel -t 60 'test/*.ppy'
+"""
+
+from queue import Queue
+from glob import glob
+import multiprocessing
+import contextlib
+import argparse
+import time
+import json
+import sys
+import os
+
+
+class HeadlessMaster(object):
+    """
+    Replacement for the Runner class providing the interface the ExecutionThread expects from its master without
+    opening any sockets.
+    """
+    def __init__(self):
+        self.nextNodePointer = None
+        self.graphData = None
+        self.status = []
+        self.runningNodes = []
+
+    def updateStatus(self, ID):
+        self.status.append((ID, time.time()))
+
+    def sendStatus(self, ID):
+        self.status.append((ID, time.time()))
+
+    def updateRunningNodes(self, running):
+        self.runningNodes = running
+
+
+def runGraph(fileName, mode='Parallel', workers=0, processes=0, framerate=0.01, timeout=60., idle=0.5,
+             pipelineDepth=0):
+    """
+    Executes a stored graph until it returns, until no node was executed for 'idle' seconds or until the timeout is
+    reached.
+    :param fileName: path of the .ppy file.
+    :param mode: execution mode of the interpreter, e.g. 'Parallel', 'Event' or 'Static'.
+    :param workers: number of worker threads. If 0, a new thread is started for every node.
+    :param processes: number of worker processes used in 'Process' mode.
+    :param framerate: sleep time between two execution steps in seconds.
+    :param timeout: maximum execution time in seconds.
+    :param idle: time in seconds without any executed node after which a graph without return value is finished.
+    :param pipelineDepth: capacity of the inputs queued by Graph.pipeline(). If 0, the graph is not pipelined.
+    :return: dictionary describing the result.
+    """
+    from floppy.graph import Graph
+    from floppy.runner import ExecutionThread, WorkerPools
+    report = {'file': fileName, 'status': 'error', 'returnValue': None, 'returningNode': None, 'executed': 0}
+    t = time.time()
+    try:
+        graph = Graph()
+        graph.load(fileName)
+    except Exception as e:
+        report['error'] = 'Cannot load graph: {}'.format(e)
+        report['time'] = time.time() - t
+        return report
+    master = HeadlessMaster()
+    cmdQueue = Queue(1)
+    thread = None
+    pools = WorkerPools()
+
+    def start(executionThread):
+        executionThread.graph = graph
+        executionThread._updateExecutor()
+        executionThread.setPipelineDepth(pipelineDepth)
+        graph.fuseChains()
+        executionThread.compilePlan()
+        executionThread.unpause()
+
+    try:
+        # The start command is queued before the thread is created so that the thread picks it up on its first step.
+        pools.setWorkers(workers)
+        pools.setProcesses(processes)
+        cmdQueue.put(start)
+        thread = ExecutionThread(cmdQueue, master)
+        thread.setFrameRate(framerate)
+        pools.assign(thread, mode)
+        thread.setMode(mode)
+        lastCount = 0
+        lastActive = time.time()
+        while True:
+            time.sleep(framerate)
+            now = time.time()
+            if not graph.returnValue == -1:
+                report['status'] = 'returned'
+                break
+            if not len(master.status) == lastCount or graph.runningNodes:
+                lastCount = len(master.status)
+                lastActive = now
+            elif now - lastActive > idle:
+                report['status'] = 'finished'
+                break
+            if now - t > timeout:
+                report['status'] = 'timeout'
+                break
+    except Exception as e:
+        report['error'] = str(e)
+    finally:
+        if thread:
+            thread.kill()
+            thread.join(1)
+        pools.shutdown()
+    report['returnValue'] = graph.returnValue if not graph.returnValue == -1 else None
+    report['returningNode'] = graph.returningNode
+    report['executed'] = len(master.status)
+    report['time'] = time.time() - t
+    return report
+
+
+def _runTask(task):
+    fileName, options, verbose = task
+    if verbose:
+        return runGraph(fileName, **options)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return runGraph(fileName, **options)
+
+
+def runBatch(fileNames, processes=1, verbose=False, **options):
+    """
+    Executes many stored graphs in a pool of worker processes.
+    Each worker process executes one graph at a time. The keyword arguments are passed on to runGraph().
+    The 'Process' mode cannot be used with more than one batch process since pool workers cannot start process pools
+    of their own.
+    :param fileNames: list of paths of .ppy files.
+    :param processes: number of graphs executed at once.
+    :param verbose: if False, the output printed by the nodes is suppressed.
+    :return: list of dictionaries as returned by runGraph() in the order of 'fileNames'.
+    """
+    if processes > 1 and options.get('mode') == 'Process':
+        raise ValueError('The Process mode requires a single batch process.')
+    from floppy.runner import loadCustomNodes
+    tasks = [(fileName, options, verbose) for fileName in fileNames]
+    with contextlib.redirect_stdout(sys.stdout if verbose else sys.stderr):
+        loadCustomNodes()
+    if processes <= 1:
+        return [_runTask(task) for task in tasks]
+    if multiprocessing.get_start_method() == 'fork':
+        initializer = None
+    else:
+        initializer = loadCustomNodes
+    with multiprocessing.Pool(processes, initializer=initializer) as pool:
+        return pool.map(_runTask, tasks, chunksize=1)
+
+
+def parseArgv(argv=None):
+    parser = argparse.ArgumentParser(description='Executes stored Floppy graphs without the graph editor.')
+    parser.add_argument('files', nargs='+', help='.ppy files or glob patterns.')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of graphs executed at once. Defaults to the number of CPUs or to 1 in the '
+                             'Process mode.')
+    parser.add_argument('-m', '--mode', default='Parallel',
+                        help='Execution mode of the interpreter. The Process mode requires a single batch process.')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='Number of worker threads per graph.')
+    parser.add_argument('-t', '--timeout', type=float, default=60., help='Maximum execution time per graph.')
+    parser.add_argument('-d', '--pipelineDepth', type=int, default=0,
+                        help='Number of values each input holds when the graph is pipelined. 0 disables pipelining.')
+    parser.add_argument('-i', '--idle', type=float, default=0.5,
+                        help='Time without executed nodes after which a graph is finished.')
+    parser.add_argument('-f', '--framerate', type=float, default=0.01, help='Sleep time between execution steps.')
+    parser.add_argument('-o', '--output', default='', help='File the JSON report is written to.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show the output of the nodes.')
+    args = parser.parse_args(argv)
+    if args.mode == 'Process':
+        if args.processes is None:
+            args.processes = 1
+        elif args.processes > 1:
+            parser.error('the Process mode starts its own worker processes and cannot be combined with more than one '
+                         'batch process (-p {})'.format(args.processes))
+    elif args.processes is None:
+        args.processes = multiprocessing.cpu_count()
+    return args
+
+
+def main(argv=None):
+    args = parseArgv(argv)
+    fileNames = []
+    for pattern in args.files:
+        fileNames += sorted(glob(pattern)) or [pattern]
+    t = time.time()
+    results = runBatch(fileNames, processes=args.processes, verbose=args.verbose, mode=args.mode,
+                       workers=args.workers, timeout=args.timeout, idle=args.idle, framerate=args.framerate,
+                       pipelineDepth=args.pipelineDepth)
+    report = json.dumps({'time': time.time() - t, 'graphs': results}, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(report)
+    else:
+        print(report)
+    return 0 if all(result['status'] in ('returned', 'finished') for result in results) else 1
@@ -0,0 +1,83 @@
+"""
+Module implementing a benchmark of the creation of nodes.
+Large graphs spend a considerable amount of time and memory on creating the input and output infos and pins of their
+nodes. The benchmark spawns many nodes of the given classes into a graph and reports the number of nodes created per
+second and the memory allocated per node.
+
+Usage:
+    python BenchmarkFloppy.py -n 20000 ToString Join
+"""
+
+import tracemalloc
+import argparse
+import time
+import json
+import gc
+
+
+def spawnNodes(nodeClass, count):
+    """
+    Spawns nodes of the given class into a new graph.
+    :param nodeClass: subclass of Node.
+    :param count: number of nodes.
+    :return: Graph instance.
+    """
+    from floppy.graph import Graph
+    graph = Graph()
+    for i in range(count):
+        graph.spawnNode(nodeClass, silent=True)
+    return graph
+
+
+def benchmark(className, count=10000, repeats=3):
+    """
+    Measures the spawn rate and the memory per node of a node class.
+    The spawn rate is the best of 'repeats' runs. The memory is measured in a separate run since tracing the memory
+    allocations slows the creation down.
+    :param className: name of the node class.
+    :param count: number of nodes spawned per run.
+    :param repeats: number of timed runs.
+    :return: dictionary describing the result.
+    """
+    import floppy.node
+    nodeClass = floppy.node.NODECLASSES[className]
+    spawnNodes(nodeClass, 10)
+    best = None
+    for i in range(repeats):
+        gc.collect()
+        t = time.perf_counter()
+        spawnNodes(nodeClass, count)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graph = spawnNodes(nodeClass, count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph
+    return {'class': className,
+            'inputs': len(nodeClass.__inputs__),
+            'outputs': len(nodeClass.__outputs__),
+            'nodesPerSecond': count / best,
+            'bytesPerNode': (after - before) / count}
+
+
+def parseArgv(argv=None):
+    parser = argparse.ArgumentParser(description='Measures how fast nodes are created and how much memory they use.')
+    parser.add_argument('classes', nargs='*', default=['CreateString', 'ToString', 'Join'],
+                        help='Names of the node classes.')
+    parser.add_argument('-n', '--count', type=int, default=10000, help='Number of nodes spawned per run.')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Number of timed runs per class.')
+    parser.add_argument('-c', '--custom', action='store_true', help='Load the custom node classes.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgv(argv)
+    if args.custom:
+        from floppy.runner import loadCustomNodes
+        loadCustomNodes()
+    results = [benchmark(className, args.count, args.repeats) for className in args.classes]
+    print(json.dumps(results, indent=2))
+    return 0
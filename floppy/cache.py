@@ -0,0 +1,425 @@
+"""
+Module implementing caches for the results of node executions.
+Nodes that set the class attribute 'cacheable = True' are deterministic functions of their inputs. Before such a node
+is executed its outputs are looked up in the result cache using a key computed from the node's class and the values of
+its inputs. On a hit the outputs are restored and 'run()' is never called.
+Nodes wrapping expensive external programs can set 'diskCacheable = True' instead. Their outputs are stored in a disk
+cache below the interpreter's work directory and survive restarts of the interpreter.
+The graphs executed by SubGraph and DynamicSubGraph nodes are kept in a separate cache so that stored graph files are
+only read once.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import pickle
+import json
+import shutil
+import os
+
+
+class ResultCache(object):
+    """
+    Thread safe least recently used cache mapping keys created by Node.cacheKey() to the outputs of a node.
+    Outputs are stored pickled so that consumers modifying a received value cannot alter the cached value.
+    """
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """
+        Returns the outputs stored for a key and marks the entry as recently used.
+        :param key: str returned by Node.cacheKey().
+        :return: dictionary as returned by Node.packOutputs() or None if the key is unknown.
+        """
+        with self.lock:
+            try:
+                data = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = data
+            self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, outputs):
+        """
+        Stores the outputs of a node and evicts the least recently used entries if the cache is full.
+        :param key: str returned by Node.cacheKey().
+        :param outputs: dictionary as returned by Node.packOutputs().
+        :return:
+        """
+        try:
+            data = pickle.dumps(outputs)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = data
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def resize(self, size):
+        """
+        Sets the maximum number of entries. A size of 0 disables the cache.
+        :param size: int
+        :return:
+        """
+        with self.lock:
+            self.size = size
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache's counters in a JSON serializable form.
+        :return: dictionary.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'size': self.size}
+
+
+def canonicalValue(value):
+    """
+    Returns a representation of a value that pickles to the same bytes for equal values. The items of dictionaries and
+    the elements of sets are sorted by their pickled form, because their iteration order depends on the insertion order
+    and on the hashes of the elements.
+    Lists, tuples, dictionaries, sets and frozensets are converted recursively. Other values are returned unchanged and
+    are only supported if equal instances pickle to equal bytes.
+    :param value: object.
+    :return: picklable object.
+    """
+    if isinstance(value, dict):
+        items = [(canonicalValue(key), canonicalValue(item)) for key, item in value.items()]
+        return ('dict', tuple(sorted(items, key=pickle.dumps)))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted((canonicalValue(item) for item in value), key=pickle.dumps)))
+    if isinstance(value, list):
+        return ('list', tuple(canonicalValue(item) for item in value))
+    if isinstance(value, tuple):
+        return tuple(canonicalValue(item) for item in value)
+    return value
+
+
+def hashValues(*values):
+    """
+    Returns a hex digest identifying a picklable collection of values.
+    Equal dictionaries, sets and frozensets give equal digests regardless of the order of their items.
+    :param values: objects.
+    :return: str or None if any value cannot be pickled.
+    """
+    try:
+        data = pickle.dumps(canonicalValue(values))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return hashlib.sha1(data).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Content addressed cache storing pickled node outputs as files in a directory.
+    Entries are evicted in least recently used order once the files exceed the size limit. Reading an entry updates its
+    modification time to mark it as recently used.
+    The cache is disabled until a directory is set.
+    """
+    def __init__(self, root=None, maxSize=512*1024*1024):
+        self.root = None
+        self.maxSize = maxSize
+        self.used = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        if root:
+            self.setRoot(root)
+
+    def setRoot(self, root):
+        """
+        Sets the directory storing the cache files and creates it if necessary.
+        :param root: path of the directory or None to disable the cache.
+        :return:
+        """
+        with self.lock:
+            self.root = None
+            if not root:
+                return
+            try:
+                os.makedirs(root, exist_ok=True)
+            except OSError:
+                return
+            self.root = root
+            self.used = sum(size for path, mtime, size in self._listEntries())
+            self._evict()
+
+    def resize(self, maxSize):
+        """
+        Sets the maximum number of bytes used by the cache files.
+        :param maxSize: int
+        :return:
+        """
+        with self.lock:
+            self.maxSize = maxSize
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """
+        Returns the outputs stored for a key.
+        :param key: str returned by Node.cacheKey().
+        :return: dictionary as returned by Node.packOutputs() or None if the key is unknown or the cache is disabled.
+        """
+        if not self.root:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                outputs = pickle.load(fp)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return outputs
+
+    def put(self, key, outputs):
+        """
+        Stores the outputs of a node. The file is written under a temporary name first to make sure concurrent readers
+        never see incomplete entries.
+        :param key: str returned by Node.cacheKey().
+        :param outputs: dictionary as returned by Node.packOutputs().
+        :return:
+        """
+        if not self.root:
+            return
+        try:
+            data = pickle.dumps(outputs)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        path = self._path(key)
+        tmpPath = '{}.{}.tmp'.format(path, os.getpid())
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmpPath, 'wb') as fp:
+                    fp.write(data)
+                try:
+                    # An existing entry is overwritten and no longer counts towards the used space.
+                    replaced = os.stat(path).st_size
+                except OSError:
+                    replaced = 0
+                os.replace(tmpPath, path)
+            except OSError:
+                return
+            self.used += len(data) - replaced
+            self._evict()
+
+    def _listEntries(self):
+        entries = []
+        for dirPath, dirNames, fileNames in os.walk(self.root):
+            for fileName in fileNames:
+                if not fileName.endswith('.pkl'):
+                    continue
+                path = os.path.join(dirPath, fileName)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        if not self.root or self.used <= self.maxSize:
+            return
+        # Evict down to 90% of the limit so that the directory is not scanned again on every following put().
+        entries = sorted(self._listEntries(), key=lambda entry: entry[1])
+        self.used = sum(size for path, mtime, size in entries)
+        for path, mtime, size in entries:
+            if self.used <= self.maxSize * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.used -= size
+
+    def stats(self):
+        """
+        Returns the cache's counters in a JSON serializable form.
+        :return: dictionary.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'used': self.used, 'size': self.maxSize}
+
+
+def programVersion(program):
+    """
+    Returns a string identifying the installed version of an external program.
+    The program's path, size and modification time are used since most programs have no common way of reporting their
+    version.
+    :param program: name of the executable.
+    :return: str or None if the program cannot be found.
+    """
+    path = shutil.which(program)
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return '{}:{}:{}'.format(path, stat.st_size, stat.st_mtime)
+
+
+def fileStamp(fileName):
+    """
+    Returns a tuple identifying the current state of a file or None if the file does not exist.
+    :param fileName: path of the file.
+    :return: tuple of the file's name, size and modification time.
+    """
+    try:
+        stat = os.stat(fileName)
+    except OSError:
+        return None
+    return fileName, stat.st_size, stat.st_mtime
+
+
+class SubGraphCache(object):
+    """
+    Thread safe cache of the graphs executed by SubGraph and DynamicSubGraph nodes.
+    For every graph file the parsed save state is kept together with a pool of graph instances created from it. Entries
+    are replaced once the file's stamp changes. A graph is checked out for one execution and checked in afterwards,
+    which resets it for the next execution. Any number of graphs of the same file can be checked out at once.
+    The number of pooled graphs of all files is limited by 'size'. If the limit is exceeded, pooled graphs of the least
+    recently used files are dropped first.
+    """
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = OrderedDict()
+        self.pooled = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, fileName):
+        path = os.path.abspath(fileName)
+        stamp = fileStamp(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry['stamp'] == stamp:
+                self.entries.move_to_end(path)
+                return path, entry
+        with open(path, 'r') as fp:
+            state = json.loads(fp.read())
+        entry = {'stamp': stamp, 'state': state, 'pool': []}
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old:
+                self.pooled -= len(old['pool'])
+            self.entries[path] = entry
+        return path, entry
+
+    def getState(self, fileName):
+        """
+        Returns the parsed save state of a graph file. The returned object must not be modified.
+        :param fileName: path of the graph file.
+        :return: list as passed to Graph.loadState().
+        """
+        return self._entry(fileName)[1]['state']
+
+    def checkOut(self, fileName):
+        """
+        Returns a graph loaded from a graph file that is not used by anybody else. A new graph is only created if all
+        graphs of the file's pool are checked out.
+        :param fileName: path of the graph file.
+        :return: Graph instance. Pass it to checkIn() after executing it.
+        """
+        path, entry = self._entry(fileName)
+        with self.lock:
+            item = entry['pool'].pop() if entry['pool'] else None
+            if item:
+                self.pooled -= 1
+                self.hits += 1
+            else:
+                self.misses += 1
+        if item:
+            graph, idMap = item
+        else:
+            from floppy.graph import Graph
+            graph = Graph()
+            idMap = graph.loadState(entry['state'])
+        graph.origin = (path, entry['stamp'], idMap)
+        return graph
+
+    def checkIn(self, graph):
+        """
+        Resets a graph returned by checkOut() and puts it back into its pool. Graphs of files that changed meanwhile are
+        dropped.
+        :param graph: Graph instance.
+        :return:
+        """
+        path, stamp, idMap = graph.origin
+        with self.lock:
+            entry = self.entries.get(path)
+        if not entry or not entry['stamp'] == stamp or not self.size:
+            return
+        graph.reset(entry['state'], idMap)
+        with self.lock:
+            if not self.entries.get(path) is entry:
+                return
+            entry['pool'].append((graph, idMap))
+            self.pooled += 1
+            self._evict()
+
+    def _evict(self):
+        # Files without pooled graphs are dropped as well. Their state is parsed again when they are used next.
+        while self.pooled > self.size:
+            path, entry = next(iter(self.entries.items()))
+            if entry['pool']:
+                entry['pool'].pop(0)
+                self.pooled -= 1
+            else:
+                del self.entries[path]
+
+    def resize(self, size):
+        """
+        Sets the maximum number of pooled graphs. A size of 0 disables pooling.
+        :param size: int
+        :return:
+        """
+        with self.lock:
+            self.size = size
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.pooled = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache's counters in a JSON serializable form.
+        :return: dictionary.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'files': len(self.entries), 'pooled': self.pooled,
+                'size': self.size}
+
+
+RESULTCACHE = ResultCache()
+DISKCACHE = DiskCache()
+SUBGRAPHS = SubGraphCache()
@@ -0,0 +1,198 @@
+"""
+Module implementing the compilation of acyclic graphs into plain Python functions.
+Executing a graph with the interpreter means checking, locking and notifying every node and passing every value
+through the inputs of the next node. Graphs that are executed very often with different input values can instead be
+compiled into one generated function. The function calls the nodes' 'run()' methods in a fixed order and keeps the
+values passed between the nodes in local variables.
+
+Nodes with a custom check(), notify() or setInput() method cannot be compiled. They are executed by the interpreter's
+logic within the compiled function, i.e. their inputs are set with setInput() and they are only run if check() returns
+True. Nodes depending on such a node are skipped if it was not run.
+
+The generated code only depends on the graph's nodes and connections. It is cached by the graph's canonical state and
+reused for every graph with the same structure.
+
+Usage:
+    graph.load('myGraph.ppy')
+    compiled = compileGraph(graph)
+    for x in range(1000000):
+        returnValue = compiled({'x': x})
+"""
+
+from threading import Lock
+import inspect
+import json
+
+import floppy.node
+import floppy.cache
+
+
+class GraphNotCompilable(Exception):
+    pass
+
+
+# Marks the output values of nodes that were not executed.
+SKIPPED = object()
+# Code objects of the generated functions mapped to the hash of the canonical state of the compiled graph.
+COMPILED = {}
+compiledLock = Lock()
+
+
+def interpret(node, values):
+    """
+    Executes a node that cannot be compiled the way the graph interpreter would.
+    :param node: Node instance.
+    :param values: tuple of (InputInfo, value) tuples of the node's connected inputs.
+    :return: True if the node was executed.
+    """
+    for inp, value in values:
+        inp.valueSet = False
+        if value is not SKIPPED:
+            node.setInput(inp.name, value, override=True)
+    if not node.check():
+        return False
+    node.runSync()
+    return True
+
+
+def isCompilable(node):
+    """
+    Returns True if the node can be executed by calling its run() method directly.
+    :param node: Node instance.
+    :return: bool
+    """
+    cls = type(node)
+    return (cls.check is floppy.node.Node.check and cls.notify is floppy.node.Node.notify and
+            cls.setInput is floppy.node.Node.setInput)
+
+
+def getOrder(graph):
+    """
+    Returns the graph's nodes in an order in which each node follows all nodes it depends on, including hidden
+    dependencies.
+    :param graph: Graph instance.
+    :return: list of Node instances.
+    """
+    if graph.compileExecutionPlan() is None:
+        raise GraphNotCompilable('Graphs containing control nodes, polled nodes, streaming nodes or cycles cannot be '
+                                 'compiled.')
+    predecessors = {node: {con['outputNode'] for con in graph.getConnectionsTo(node)} |
+                    (set(node.hiddenDependencies()) - {node}) for node in graph.nodes.values()}
+    order = []
+    done = set()
+    ready = sorted([node for node, before in predecessors.items() if not before], key=lambda node: node.ID)
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        done.add(node)
+        for successor, before in predecessors.items():
+            if node in before and successor not in done and successor not in ready and before <= done:
+                ready.append(successor)
+    if len(order) < len(graph.nodes):
+        raise GraphNotCompilable('Hidden dependencies of the graph form a cycle.')
+    return order
+
+
+def generateSource(graph):
+    """
+    Generates the source code of a function binding the compiled graph function to a graph instance.
+    :param graph: Graph instance.
+    :return: str
+    """
+    order = getOrder(graph)
+    dead = set()
+    mayskip = set()
+    outputVars = {}
+    head = ['def bind(graph):',
+            '    nodes = graph.nodes']
+    body = ['    def compiledGraph(inputs=None):',
+            '        graph.INPUTVALUES = inputs if inputs is not None else {}',
+            '        graph.returnValue = -1',
+            '        graph.returnPriority = -1',
+            '        graph.returningNode = None']
+    for node in order:
+        connections = {con['inputName']: con for con in graph.getConnectionsTo(node)}
+        producers = {con['outputNode'] for con in connections.values()}
+        if producers & dead or any(inp.default is None and not inp.optional for name, inp in node.inputs.items()
+                                   if name not in connections):
+            # The node can never be ready.
+            dead.add(node)
+            continue
+        n = 'n{}'.format(node.ID)
+        head.append('    {} = nodes[{}]'.format(n, node.ID))
+        inputs = []
+        for index, name in enumerate(node.inputs.keys()):
+            if name in connections:
+                con = connections[name]
+                i = 'i{}_{}'.format(node.ID, index)
+                head.append('    {} = {}.inputs[{!r}]'.format(i, n, name))
+                inputs.append((i, outputVars[(con['outputNode'], con['outputName'])]))
+        outputs = []
+        for index, name in enumerate(node.outputs.keys()):
+            o = 'o{}_{}'.format(node.ID, index)
+            head.append('    {} = {}.outputs[{!r}]'.format(o, n, name))
+            outputVars[(node, name)] = 'v{}_{}'.format(node.ID, index)
+            outputs.append((o, outputVars[(node, name)]))
+        code = ['# {}'.format(node)]
+        if isCompilable(node):
+            skippable = producers & mayskip
+            code += ['{}.value = {}'.format(i, v) for i, v in inputs]
+            code += ['{}.valueSet = True'.format(i) for i, v in inputs]
+            code += ['{}.valueSet = False'.format(o) for o, v in outputs]
+            if node.cacheable or node.diskCacheable or inspect.iscoroutinefunction(node.run):
+                code.append('{}.runSync()'.format(n))
+            else:
+                code.append('{}.run()'.format(n))
+            code += ['{1} = {0}.value if {0}.valueSet else {0}.default'.format(o, v) for o, v in outputs]
+            if skippable:
+                mayskip.add(node)
+                condition = ' or '.join('{} is SKIPPED'.format(v) for i, v in inputs)
+                skipped = ['{} = SKIPPED'.format(v) for o, v in outputs] or ['pass']
+                code = [code[0], 'if {}:'.format(condition)] + ['    ' + line for line in skipped] + \
+                       ['else:'] + ['    ' + line for line in code[1:]]
+        else:
+            mayskip.add(node)
+            code.append('if interpret({}, ({})):'.format(n, ''.join('({}, {}), '.format(i, v) for i, v in inputs)))
+            code += ['    {1} = {0}.value if {0}.valueSet else {0}.default'.format(o, v) for o, v in outputs] or \
+                    ['    pass']
+            code.append('else:')
+            code += ['    {} = SKIPPED'.format(v) for o, v in outputs] or ['    pass']
+        body += ['        ' + line for line in code]
+    for node in order:
+        if node not in dead:
+            for inp in node.inputs.values():
+                head.append('    n{}.inputs[{!r}].valueSet = False'.format(node.ID, inp.name))
+    body.append('        return graph.returnValue')
+    return '\n'.join(head + body + ['    return compiledGraph', ''])
+
+
+def getKey(graph):
+    """
+    Returns a key identifying the structure of a graph, i.e. its nodes' classes, defaults and connections.
+    :param graph: Graph instance.
+    :return: str
+    """
+    state = graph.canonicalState(json.loads(graph.toJson()))
+    return floppy.cache.hashValues(sorted(state.items()))
+
+
+def compileGraph(graph):
+    """
+    Compiles an acyclic graph into a function executing all of its nodes.
+    The function takes an optional dictionary of the values read by the graph's InputNodes and returns the graph's
+    return value. Exceptions raised by a node are passed on to the caller.
+    The graph must not be executed by anything else while the function is used. Compile graphs before executing them
+    since the interpreter discards the default values of inputs that were used.
+    :param graph: Graph instance.
+    :return: callable.
+    """
+    key = getKey(graph)
+    with compiledLock:
+        code = COMPILED.get(key)
+    if code is None:
+        code = compile(generateSource(graph), '<compiled graph {}>'.format(key), 'exec')
+        with compiledLock:
+            COMPILED[key] = code
+    namespace = {'SKIPPED': SKIPPED, 'interpret': interpret}
+    exec(code, namespace)
+    return namespace['bind'](graph)
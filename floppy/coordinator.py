@@ -0,0 +1,577 @@
+"""
+Module implementing the distributed execution of a single graph by several graph interpreters.
+The coordinator partitions a graph, either by the nodes' subgraph names or by a balanced minimum cut of its
+connections, and pushes every partition as a session to one interpreter. Every connection crossing two partitions is
+replaced by a RemoteSend node in the partition of the producing node and a RemoteReceive node in the partition of the
+consuming node. Values are shipped directly between the interpreters with the SETINPUT command of the existing framed
+socket protocol.
+
+Nodes that depend on each other in both directions, e.g. loops and their bodies, and nodes with hidden dependencies,
+e.g. SetValue and GetValue nodes, are always assigned to the same partition.
+
+Usage:
+    python DistributedFloppy.py -s 4 graph.ppy
+    python DistributedFloppy.py -r host1:8079 -r host2:8079 -S subgraph graph.ppy
+"""
+
+from socket import AF_INET, SOCK_STREAM, socket
+from threading import Lock
+from uuid import uuid4
+import subprocess
+import argparse
+import struct
+import time
+import json
+import sys
+import os
+
+from floppy.runner import encodeValue
+
+
+class RemoteLink(object):
+    """
+    Blocking connection to a graph interpreter. Unlike RGIConnection every command waits for the interpreter's answer
+    which is returned to the caller.
+    """
+    def __init__(self, host, port, timeout=30.):
+        self.host = host
+        self.port = int(port)
+        self.lock = Lock()
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect((host, self.port))
+
+    def send(self, message):
+        """
+        Sends a command and waits for the answer.
+        :param message: command string.
+        :return: answer string or None if the connection was closed.
+        """
+        data = message.encode('utf-8')
+        with self.lock:
+            self.socket.sendall(struct.pack('>I', len(data)) + data)
+            return self._receive()
+
+    def close(self):
+        self.socket.close()
+
+    def _recvall(self, n):
+        data = b''
+        while len(data) < n:
+            packet = self.socket.recv(n - len(data))
+            if not packet:
+                return None
+            data += packet
+        return data
+
+    def _receive(self):
+        rawLength = self._recvall(4)
+        if not rawLength:
+            return None
+        data = self._recvall(struct.unpack('>I', rawLength)[0])
+        return data.decode('utf-8') if data is not None else None
+
+
+LINKS = {}
+linkLock = Lock()
+
+
+def getLink(host, port):
+    """
+    Returns the shared connection of this process to an interpreter and creates it if necessary.
+    :param host: str
+    :param port: int
+    :return: RemoteLink instance.
+    """
+    with linkLock:
+        try:
+            return LINKS[(host, int(port))]
+        except KeyError:
+            link = LINKS[(host, int(port))] = RemoteLink(host, port)
+            return link
+
+
+def dropLink(host, port):
+    """
+    Closes and forgets the shared connection to an interpreter, e.g. after the connection broke.
+    :param host: str
+    :param port: int
+    :return:
+    """
+    with linkLock:
+        link = LINKS.pop((host, int(port)), None)
+    if link:
+        link.close()
+
+
+def parseTarget(target):
+    """
+    Splits a target string of the form 'host:port@sessionID#nodeID:inputName'.
+    :param target: str
+    :return: tuple of host, port, sessionID, nodeID and inputName.
+    """
+    address, _, rest = target.partition('@')
+    sessionID, _, pin = rest.partition('#')
+    host, _, port = address.rpartition(':')
+    nodeID, _, inputName = pin.partition(':')
+    return host, int(port), sessionID, int(nodeID), inputName
+
+
+def sendValue(target, value, loopLevel=0):
+    """
+    Sets an input of a node executed by another interpreter.
+    :param target: str of the form 'host:port@sessionID#nodeID:inputName'.
+    :param value: picklable object.
+    :param loopLevel: loop level of the sending node.
+    :return:
+    """
+    host, port, sessionID, nodeID, inputName = parseTarget(target)
+    message = 'SETINPUT' + json.dumps({'node': nodeID, 'input': inputName, 'value': encodeValue(value),
+                                       'loopLevel': loopLevel})
+    if sessionID:
+        message = '@{} {}'.format(sessionID, message)
+    answer = getLink(host, port).send(message)
+    if not answer == 'Input set.':
+        raise RuntimeError('Interpreter {}:{} rejected value for {}: {}'.format(host, port, target, answer))
+
+
+class Coordinator(object):
+    """
+    Executes one graph with several graph interpreters.
+    Every interpreter receives one partition of the graph as a session. Several coordinators can use the same
+    interpreters at once since the session IDs are unique.
+    """
+    def __init__(self, graph, runners, strategy='cut', imbalance=.1):
+        """
+        :param graph: Graph instance.
+        :param runners: list of (host, port) tuples or 'host:port' strings of running graph interpreters.
+        :param strategy: 'cut' to minimize the number of connections between balanced partitions or 'subgraph' to
+        keep the nodes of each subgraph together.
+        :param imbalance: fraction by which the estimated execution time of a partition may exceed the average in the
+        'cut' strategy.
+        """
+        self.graph = graph
+        self.runners = [parseAddress(runner) for runner in runners]
+        self.strategy = strategy
+        self.imbalance = imbalance
+        self.sessionID = 'partition-{}'.format(uuid4().hex[:8])
+        self.assignment = {}
+        self.links = []
+        self.sessions = []
+
+    def getGroups(self):
+        """
+        Returns the groups of nodes that must be executed by the same interpreter. These are the strongly connected
+        components of the graph merged with the nodes' hidden dependencies.
+        :return: list of lists of Node instances in topological order of the groups.
+        """
+        nodes = list(self.graph.nodes.values())
+        successors = {node: [con['inputNode'] for con in self.graph.getConnectionsFrom(node)] for node in nodes}
+        predecessors = {node: [con['outputNode'] for con in self.graph.getConnectionsTo(node)] for node in nodes}
+        # Kosaraju's algorithm. The components are found in topological order.
+        finished = []
+        visited = set()
+        for start in nodes:
+            if start in visited:
+                continue
+            visited.add(start)
+            stack = [(start, iter(successors[start]))]
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    if child not in visited:
+                        visited.add(child)
+                        stack.append((child, iter(successors[child])))
+                        break
+                else:
+                    stack.pop()
+                    finished.append(node)
+        component = {}
+        components = []
+        for start in reversed(finished):
+            if start in component:
+                continue
+            members = [start]
+            component[start] = len(components)
+            for node in members:
+                for pred in predecessors[node]:
+                    if pred not in component:
+                        component[pred] = len(components)
+                        members.append(pred)
+            components.append(members)
+
+        parents = list(range(len(components)))
+
+        def find(i):
+            while not parents[i] == i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        def union(i, j):
+            i, j = find(i), find(j)
+            parents[max(i, j)] = min(i, j)
+
+        for node in nodes:
+            for dependency in node.hiddenDependencies():
+                union(component[node], component[dependency])
+        if self.strategy == 'subgraph':
+            first = {}
+            for node in nodes:
+                union(component[node], first.setdefault(node.subgraph, component[node]))
+        groups = {}
+        for i, members in enumerate(components):
+            groups.setdefault(find(i), []).extend(members)
+        return [groups[key] for key in sorted(groups.keys())]
+
+    def partition(self):
+        """
+        Assigns every node of the graph to one of the interpreters.
+        :return: dictionary mapping node IDs to indices of self.runners.
+        """
+        groups = self.getGroups()
+        runtimes = self.graph.RUNTIMES
+        default = sum(runtimes.values()) / len(runtimes) if runtimes else 1.
+        weights = [sum(runtimes.get(node.__class__.__name__, default) for node in group) for group in groups]
+        if self.strategy == 'subgraph':
+            parts = self._partitionLargestFirst(weights)
+        elif self.strategy == 'cut':
+            parts = self._partitionMinCut(groups, weights)
+        else:
+            raise ValueError('Unknown partitioning strategy \'{}\'.'.format(self.strategy))
+        self.assignment = {node.ID: part for group, part in zip(groups, parts) for node in group}
+        return self.assignment
+
+    def _partitionLargestFirst(self, weights):
+        loads = [0.] * len(self.runners)
+        parts = [0] * len(weights)
+        for i in sorted(range(len(weights)), key=lambda i: -weights[i]):
+            part = loads.index(min(loads))
+            parts[i] = part
+            loads[part] += weights[i]
+        return parts
+
+    def _partitionMinCut(self, groups, weights):
+        """
+        Greedy balanced partitioning followed by moving single groups as long as the number of connections between
+        partitions decreases.
+        """
+        count = len(self.runners)
+        groupOf = {node: i for i, group in enumerate(groups) for node in group}
+        edges = [{} for group in groups]
+        for i, group in enumerate(groups):
+            for node in group:
+                for con in self.graph.getConnectionsFrom(node):
+                    j = groupOf[con['inputNode']]
+                    if not i == j:
+                        edges[i][j] = edges[i].get(j, 0) + 1
+                        edges[j][i] = edges[j].get(i, 0) + 1
+        capacity = max(sum(weights) / count * (1 + self.imbalance), max(weights, default=0))
+        loads = [0.] * count
+        parts = [None] * len(groups)
+        # Groups are placed in topological order next to the groups they are connected to.
+        for i in range(len(groups)):
+            links = [0] * count
+            for j, n in edges[i].items():
+                if parts[j] is not None:
+                    links[parts[j]] += n
+            fitting = [part for part in range(count) if loads[part] + weights[i] <= capacity] or range(count)
+            part = max(fitting, key=lambda part: (links[part], -loads[part]))
+            parts[i] = part
+            loads[part] += weights[i]
+        for iteration in range(10):
+            moved = False
+            for i in range(len(groups)):
+                links = [0] * count
+                for j, n in edges[i].items():
+                    links[parts[j]] += n
+                current = parts[i]
+                for part in range(count):
+                    if links[part] > links[current] and loads[part] + weights[i] <= capacity:
+                        current = part
+                if not current == parts[i]:
+                    loads[parts[i]] -= weights[i]
+                    loads[current] += weights[i]
+                    parts[i] = current
+                    moved = True
+            if not moved:
+                break
+        return parts
+
+    def getCut(self):
+        """
+        Returns all connections between nodes assigned to different interpreters.
+        :return: list of Connection instances.
+        """
+        return [con for node in self.graph.nodes.values() for con in self.graph.getConnectionsFrom(node)
+                if not self.assignment[con['outputNode'].ID] == self.assignment[con['inputNode'].ID]]
+
+    def buildPartitions(self):
+        """
+        Creates the graphs executed by the interpreters. Connections between partitions are replaced by pairs of
+        RemoteSend and RemoteReceive nodes.
+        :return: list of Graph instances, one for each interpreter. Empty partitions are None.
+        """
+        from floppy.graph import Graph
+        from floppy.node import RemoteSend, RemoteReceive
+        if not self.assignment:
+            self.partition()
+        saveState = json.loads(self.graph.toJson())
+        partitions = []
+        for part in range(len(self.runners)):
+            nodeIDs = {ID for ID, assigned in self.assignment.items() if assigned == part}
+            if not nodeIDs:
+                partitions.append(None)
+                continue
+            partition = Graph()
+            partition.loadState(filterState(saveState, nodeIDs), reuseIDs=True)
+            partitions.append(partition)
+        nextID = max(self.graph.nodes.keys(), default=-1) + 1
+        receivers = {}
+        for con in self.getCut():
+            outNode, inpNode = con['outputNode'], con['inputNode']
+            source, target = partitions[self.assignment[outNode.ID]], partitions[self.assignment[inpNode.ID]]
+            key = (outNode.ID, con['outputName'], self.assignment[inpNode.ID])
+            if key not in receivers:
+                receiver = target.spawnNode(RemoteReceive, position=inpNode.__pos__, silent=True, useID=nextID)
+                sender = source.spawnNode(RemoteSend, position=outNode.__pos__, silent=True, useID=nextID + 1)
+                nextID += 2
+                host, port = self.runners[self.assignment[inpNode.ID]]
+                sender.inputs['Target'].setDefault('{}:{}@{}#{}:Value'.format(host, port,
+                                                                             self.getSessionID(self.assignment[inpNode.ID]),
+                                                                             receiver.ID))
+                source.connect(source.nodes[outNode.ID], con['outputName'], sender, 'Value')
+                receivers[key] = receiver
+            target.connect(receivers[key], 'Output', target.nodes[inpNode.ID], con['inputName'])
+        return partitions
+
+    def getSessionID(self, part):
+        return '{}-{}'.format(self.sessionID, part)
+
+    def start(self, mode='Parallel', framerate=0.01, timeout=10., workers=0, steal=False):
+        """
+        Pushes the partitions to the interpreters and starts their execution once every interpreter has loaded its
+        partition.
+        :param mode: execution mode of the interpreters.
+        :param framerate: sleep time between two execution steps in seconds.
+        :param timeout: maximum time in seconds to wait for the interpreters to load their partitions.
+        :param workers: number of worker threads of each interpreter. If 0, the interpreters' setting is kept.
+        :param steal: if True, the interpreters are made peers of each other and idle interpreters take queued
+        stateless nodes from busy ones. Requires worker pools.
+        :return:
+        """
+        partitions = self.buildPartitions()
+        self.sessions = []
+        for part, partition in enumerate(partitions):
+            if not partition:
+                continue
+            sessionID = self.getSessionID(part)
+            link = RemoteLink(*self.runners[part])
+            self.links.append(link)
+            self.sessions.append((sessionID, link, len(partition.nodes)))
+            link.send('@{} PUSH{}'.format(sessionID, partition.serialize()))
+            options = {'mode': mode, 'framerate': framerate}
+            if workers:
+                options['workers'] = workers
+            if steal:
+                options['peers'] = ['{}:{}'.format(*runner) for runner in self.runners
+                                    if not runner == self.runners[part]]
+            link.send('@{} CONFIGURE{}'.format(sessionID, json.dumps(options)))
+        t = time.time()
+        while not all(self._isLoaded(sessionID, link, size) for sessionID, link, size in self.sessions):
+            if time.time() - t > timeout:
+                raise RuntimeError('Interpreters did not load their partitions within {} seconds.'.format(timeout))
+            time.sleep(.05)
+        for sessionID, link, size in self.sessions:
+            link.send('@{} UNPAUSE'.format(sessionID))
+
+    def _isLoaded(self, sessionID, link, size):
+        sessions = json.loads(link.send('SESSIONS'))
+        return sessionID in sessions and sessions[sessionID]['nodes'] == size
+
+    def wait(self, timeout=60., idle=.5):
+        """
+        Waits until one partition returns, until no interpreter executed a node for 'idle' seconds or until the timeout
+        is reached.
+        :param timeout: maximum execution time in seconds.
+        :param idle: time in seconds without any executed node after which a graph without return value is finished.
+        :return: dictionary describing the result.
+        """
+        report = {'status': 'timeout', 'returnValue': None, 'returningNode': None, 'executed': 0}
+        t = lastActive = time.time()
+        while time.time() - t < timeout:
+            active = False
+            for sessionID, link, size in self.sessions:
+                status = json.loads(link.send('@{} STATUS***'.format(sessionID)))
+                if status['STATUS'] == 'RETURN':
+                    report['status'] = 'returned'
+                    report['returnValue'], report['returningNode'] = status['REPORT']
+                    return report
+                report['executed'] += len(status['STATUS']['ran'])
+                if status['STATUS']['ran'] or status['STATUS']['running']:
+                    active = True
+            now = time.time()
+            if active:
+                lastActive = now
+            elif now - lastActive > idle:
+                report['status'] = 'finished'
+                return report
+            time.sleep(.05)
+        return report
+
+    def stop(self):
+        """
+        Closes the sessions of all partitions.
+        :return:
+        """
+        for sessionID, link, size in self.sessions:
+            try:
+                link.send('@{} KILL'.format(sessionID))
+                link.close()
+            except OSError:
+                pass
+        self.sessions = []
+        self.links = []
+
+    def run(self, mode='Parallel', framerate=0.01, timeout=60., idle=.5, workers=0, steal=False):
+        """
+        Executes the graph with all interpreters and closes the sessions afterwards.
+        :return: dictionary describing the result as returned by wait() extended by information about the partitions.
+        """
+        t = time.time()
+        self.start(mode, framerate, workers=workers, steal=steal)
+        try:
+            report = self.wait(timeout, idle)
+        finally:
+            self.stop()
+        report['time'] = time.time() - t
+        report['cut'] = len(self.getCut())
+        report['partitions'] = [{'runner': '{}:{}'.format(*runner),
+                                 'nodes': sorted(ID for ID, part in self.assignment.items() if part == i)}
+                                for i, runner in enumerate(self.runners)]
+        return report
+
+
+def parseAddress(address):
+    """
+    Converts 'host:port' strings into (host, port) tuples.
+    :param address: str or tuple.
+    :return: tuple of host and port.
+    """
+    if isinstance(address, str):
+        host, _, port = address.rpartition(':')
+        return host or '127.0.0.1', int(port)
+    host, port = address
+    return host, int(port)
+
+
+def filterState(saveState, nodeIDs):
+    """
+    Returns the part of a graph's save state describing the given nodes without connections to any other node.
+    :param saveState: list of (nodeID, nodeData) pairs as created by Graph.toJson().
+    :param nodeIDs: set of node IDs.
+    :return: list of (nodeID, nodeData) pairs.
+    """
+    state = []
+    for ID, nodeData in saveState:
+        if ID not in nodeIDs:
+            continue
+        nodeData = dict(nodeData)
+        nodeData['inputConnections'] = {inputName: outputID for inputName, outputID
+                                        in nodeData['inputConnections'].items()
+                                        if int(outputID.split(':O')[0]) in nodeIDs}
+        nodeData['outputConnections'] = {outputName: [inputID for inputID in inputIDs
+                                                      if int(inputID.split(':I')[0]) in nodeIDs]
+                                         for outputName, inputIDs in nodeData['outputConnections'].items()}
+        state.append((ID, nodeData))
+    return state
+
+
+def spawnLocalRunners(ports, timeout=10.):
+    """
+    Starts graph interpreters listening on the given ports of this machine as subprocesses.
+    :param ports: list of port numbers.
+    :param timeout: maximum time in seconds to wait for an interpreter to accept connections.
+    :return: list of Popen instances.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root, env['PYTHONPATH']]) if env.get('PYTHONPATH') else root
+    processes = []
+    for port in ports:
+        processes.append(subprocess.Popen([sys.executable, '-c',
+                                           'import floppy.runner; floppy.runner.spawnRunner({})'.format(port)],
+                                          env=env, stdout=subprocess.DEVNULL))
+    for port in ports:
+        t = time.time()
+        while True:
+            try:
+                link = RemoteLink('127.0.0.1', port)
+            except OSError:
+                if time.time() - t > timeout:
+                    raise RuntimeError('Interpreter on port {} did not start.'.format(port))
+                time.sleep(.1)
+            else:
+                link.send('READY?')
+                link.close()
+                break
+    return processes
+
+
+def killLocalRunners(ports, processes):
+    for port in ports:
+        try:
+            link = RemoteLink('127.0.0.1', port)
+            link.send('KILL')
+            link.close()
+        except OSError:
+            pass
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def parseArgv(argv=None):
+    parser = argparse.ArgumentParser(description='Executes a stored Floppy graph with several graph interpreters.')
+    parser.add_argument('file', help='.ppy file.')
+    parser.add_argument('-r', '--runner', action='append', default=[],
+                        help='Address host:port of a running graph interpreter. Can be given several times.')
+    parser.add_argument('-s', '--spawn', type=int, default=0,
+                        help='Number of graph interpreters started on this machine.')
+    parser.add_argument('-p', '--port', type=int, default=8100, help='First port used by started interpreters.')
+    parser.add_argument('-S', '--strategy', default='cut', choices=['cut', 'subgraph'],
+                        help='Partitioning strategy.')
+    parser.add_argument('-m', '--mode', default='Parallel', help='Execution mode of the interpreters.')
+    parser.add_argument('-t', '--timeout', type=float, default=60., help='Maximum execution time.')
+    parser.add_argument('-i', '--idle', type=float, default=0.5,
+                        help='Time without executed nodes after which the graph is finished.')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='Number of worker threads per interpreter.')
+    parser.add_argument('-W', '--steal', action='store_true',
+                        help='Let idle interpreters execute queued stateless nodes of busy ones. Requires \'-w\'.')
+    parser.add_argument('-f', '--framerate', type=float, default=0.01, help='Sleep time between execution steps.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from floppy.graph import Graph
+    from floppy.runner import loadCustomNodes
+    args = parseArgv(argv)
+    loadCustomNodes()
+    graph = Graph()
+    graph.load(args.file)
+    ports = [args.port + i for i in range(args.spawn)]
+    processes = spawnLocalRunners(ports) if ports else []
+    try:
+        runners = args.runner + ['127.0.0.1:{}'.format(port) for port in ports]
+        if not runners:
+            print('Error: No graph interpreters given.')
+            return 1
+        report = Coordinator(graph, runners, args.strategy).run(args.mode, args.framerate, args.timeout, args.idle,
+                                                                  args.workers, args.steal)
+    finally:
+        killLocalRunners(ports, processes)
+    report['file'] = args.file
+    print(json.dumps(report, indent=2, default=str))
+    return 0 if report['status'] in ('returned', 'finished') else 1
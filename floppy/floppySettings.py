@@ -20,6 +20,7 @@ class SettingsDialog(QDialog):
                         ('Remote Interpreter Settings', None),
                         ('Frame Rate', RGIFrameRateEdit(settings, globals, self)),
                         ('Execution Mode', RGIModeEdit(settings, globals, self)),
+                        ('Worker Threads', RGIWorkersEdit(settings, globals, self)),
                         ]
         super(SettingsDialog, self).__init__(*args)
         self.setStyleSheet('''SettingsDialog {
@@ -292,6 +293,23 @@ class RGIFrameRateEdit(QLineEdit):
         self.settings.setValue('FrameRate', float(self.text()))
 
 
+class RGIWorkersEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIWorkersEdit, self).__init__()
+        v = settings.value('RGIWorkers', type=int)
+        v = v if v else 0
+        self.setRange(0, 1024)
+        self.setValue(v)
+        self.setToolTip('Number of threads used for executing nodes in parallel.\n'
+                        '0 starts a new thread for every node.')
+
+    def commit(self):
+        self.settings.setValue('RGIWorkers', self.value())
+
+
 class RGIModeEdit(QComboBox):
     def __init__(self, settings, globals, parent):
         self.parent = parent
@@ -301,9 +319,15 @@ class RGIModeEdit(QComboBox):
         v = settings.value('RGIMode', type=str)
         v = v if v else 'Parallel'
         self.addItem('Parallel')
+        self.addItem('Event')
+        self.addItem('Process')
+        self.addItem('Static')
         self.addItem('Sequential')
         self.setCurrentText(v)
-        self.setToolTip('Sequential or parallel node execution.')
+        self.setToolTip('Sequential or parallel node execution.\n'
+                        'The \'Event\' mode is a parallel mode that only checks nodes whose inputs changed.\n'
+                        'The \'Process\' mode runs stateless nodes in a pool of worker processes.\n'
+                        'The \'Static\' mode runs graphs without loops and switches in a precompiled order.')
 
     def commit(self):
         self.settings.setValue('RGIMode', self.currentText())
\ No newline at end of file
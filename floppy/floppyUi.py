@@ -415,14 +415,26 @@ class Painter2D(Painter):
         menu = QMenu(self)
         if not node in self.triggers:
             triggerAction = menu.addAction('Add Trigger')
-            action = menu.exec_(self.mapToGlobal(event.pos()))
-            if action == triggerAction:
-                self.triggers.add(node)
         else:
             triggerAction = menu.addAction('Remove Trigger')
-            action = menu.exec_(self.mapToGlobal(event.pos()))
-            if action == triggerAction:
+        queueMenu = menu.addMenu('Queue Input')
+        queueActions = {}
+        for name, inp in node.inputs.items():
+            if not name == 'Control':
+                queueActions[queueMenu.addAction('{} ({})'.format(name, inp.queue))] = inp
+        action = menu.exec_(self.mapToGlobal(event.pos()))
+        if action == triggerAction:
+            if not node in self.triggers:
+                self.triggers.add(node)
+            else:
                 self.triggers.discard(node)
+        elif action in queueActions:
+            inp = queueActions[action]
+            capacity, ok = QInputDialog.getInt(self, 'Queue Input',
+                                               'Number of values queued by \'{}\' (0 to disable):'.format(inp.name),
+                                               inp.queue, 0)
+            if ok:
+                inp.setQueue(capacity)
         return None
 
     def paintEvent(self, event):
@@ -2086,9 +2098,14 @@ QDialog {
         dialog.show()
 
     def configureInterpreter(self):
+        self.getGraph().configureInterpreter(self.getInterpreterOptions())
+
+    def getInterpreterOptions(self):
         frameRate = self.settings.value('FrameRate', type=float)
         mode = self.settings.value('RGIMode', type=str)
-        self.getGraph().configureInterpreter({'framerate': frameRate, 'mode': mode})
+        workers = self.settings.value('RGIWorkers', type=int)
+        workDir = self.settings.value('WorkDir', type=str)
+        return {'framerate': frameRate, 'mode': mode, 'workers': workers, 'workDir': os.path.abspath(workDir) if workDir else ''}
 
     def getSubgraphList(self):
         new = self.getPainter().getAllSubgraphs()
@@ -2254,9 +2271,7 @@ QDialog {
         logger.debug('Connected to Runner.')
 
     def runCode(self, *args):
-        frameRate = self.settings.value('FrameRate', type=float)
-        mode = self.settings.value('RGIMode', type=str)
-        self.activeGraph.execute(options={'framerate': frameRate, 'mode': mode}, reuse=1)
+        self.activeGraph.execute(options=self.getInterpreterOptions(), reuse=1)
         self.statusBar.showMessage('Code execution started.', 2000)
 
     def loadGraph(self, *args, override=False, makeActive=True):
@@ -6,9 +6,17 @@ from collections import OrderedDict
 import floppy
 from floppy.runner import Runner, sendCommand, RGIConnection
 from socket import AF_INET, SOCK_STREAM, socket #, SHUT_RDWR, timeout, SHUT_RDWR, SO_REUSEADDR, SOL_SOCKET
-from threading import Thread, Lock
-from queue import Queue
+from threading import Thread, Lock, Event, Semaphore, current_thread
+from queue import Queue, PriorityQueue
+from itertools import count
+import heapq
 import struct
+import multiprocessing
+import contextlib
+import asyncio
+import inspect
+import os
+import sys
 
 
 def dummy(nodeClass):
@@ -25,6 +33,12 @@ class Graph(object):
     # nextFreeNodeID = 0
     # nodes = {}
     SHAREDRUNNERS = []
+    # Average execution time in seconds of each node class observed by this interpreter.
+    RUNTIMES = {}
+    # Number of running nodes using each resource declared with 'Resource(name, limit)' and the nodes waiting for one.
+    RESOURCES = {}
+    RESOURCEWAITING = []
+    resourceLock = Lock()
 
     def __init__(self, painter=None):
         self.returnValue = -1
@@ -50,6 +64,25 @@ class Graph(object):
         self.status = None
         self.reverseConnections = {}
         self.rgiConnection = None
+        self.readyQueue = ReadyQueue()
+        self.polledNodes = []
+        self.executor = None
+        self.priorities = {}
+        self.prioritiesTime = 0
+        self.appliedState = {}
+        self.dirtyNodes = set()
+        # (nodeID, reason) of nodes cancelled since the interpreter's status was reported last.
+        self.cancelledNodes = []
+        # Commands are addressed to this session if the graph shares an interpreter with other graphs.
+        self.sessionID = ''
+        # (path, file stamp, idMap) of graphs checked out from floppy.cache.SUBGRAPHS.
+        self.origin = None
+        # Nodes executed right after their predecessor by the same worker. See fuseChains().
+        self.fusedSuccessors = {}
+        self.fusedPredecessors = {}
+        # Inputs turned into queued inputs by pipeline().
+        self.pipelineDepth = 0
+        self.pipelinedInputs = set()
         # self.statusLock = Lock()
         if painter:
             self.painter = painter
@@ -88,6 +121,18 @@ class Graph(object):
     def registerExisitingInterpreterConnection(self, connection):
         self.rgiConnection = connection
 
+    def sendToRunner(self, message, callback):
+        """
+        Sends a command to the connected graph interpreter. The command is prefixed with the graph's session ID if one
+        is set.
+        :param message: command string.
+        :param callback: callable receiving the interpreter's answer.
+        :return:
+        """
+        if self.sessionID:
+            message = '@{} {}'.format(self.sessionID, message)
+        self.rgiConnection.send(message, callback)
+
     def __getattr__(self, item):
         if item == 'newID':
             newID = self.nextFreeNodeID
@@ -152,9 +197,13 @@ class Graph(object):
         :return: newly created Node instance.
         """
         # nodeClass = self.decorator(nodeClass, position)
-        newNode = nodeClass(self.newID, self)
-        if useID:
-            newNode.ID = useID
+        if useID is False:
+            nodeID = self.newID
+        else:
+            # IDs of nodes restored with their original ID, e.g. partitions of a graph, need not be contiguous.
+            nodeID = useID
+            self.nextFreeNodeID = max(self.nextFreeNodeID, nodeID + 1)
+        newNode = nodeClass(nodeID, self)
         self.reverseConnections[newNode] = set()
         self.connections[newNode] = set()
         if connections:
@@ -165,6 +214,9 @@ class Graph(object):
             pass
         self.nodes[newNode.ID] = newNode
         self.newestNode = newNode
+        if newNode.polled:
+            self.polledNodes.append(newNode)
+        self.readyQueue.push(newNode)
 
         return newNode
 
@@ -270,6 +322,7 @@ class Graph(object):
         inpInfo.setConnected(True)
         self.connections[outNode].add(conn)
         self.reverseConnections[inpNode].add(conn)
+        self.prioritiesTime = 0
         if inp == 'Control' and inpNode.waitForAllControlls:
             # print(self.getConnectionsOfControlInput(inpInfo))
             inpInfo.setMultiConn(len(self.getConnectionsOfControlInput(inpInfo)))
@@ -372,25 +425,331 @@ class Graph(object):
         self.configureInterpreter(options)
         self.unpauseRunner()
 
-    def selfExecute(self):
+    def selfExecute(self, verbose=True):
         running = True
         i = 0
         while running:
             i += 1
-            print('\nExecuting iteration {}.'.format(i))
+            if verbose:
+                print('\nExecuting iteration {}.'.format(i))
             running = False
             for node in self.nodes.values():
                 checked = node.check()
                 running = checked if not running else True
                 if checked:
-                    node.run()
+                    node.runSync()
                     node.notify()
 
-    def runNodePar(self, node, cb=None, arg=None):
+    def runNodePar(self, node, cb=None, arg=None, done=None):
+        """
+        Executes a locked node concurrently. If an executor was assigned to the graph, e.g. a NodePool, the node is
+        submitted to the executor. Otherwise a new NodeThread is started for the node.
+        :param node: Node instance.
+        :param cb: callable that is called with 'arg' after the node was executed successfully.
+        :param arg: argument passed to 'cb'.
+        :param done: callable that is called with the node after the execution finished, successfully or not.
+        :return:
+        """
         self.runningNodes.append(node.ID)
-        t = NodeThread(node, cb, arg)
+        if inspect.iscoroutinefunction(node.run):
+            getAsyncLoop().submit(node, cb, arg, done)
+        elif self.executor:
+            self.executor.submit(node, cb, arg, done, priority=self.priorities.get(node.ID, 0))
+        else:
+            t = NodeThread(node, cb, arg, done)
         # t.join()
 
+    def sortByPriority(self, nodes):
+        """
+        Sorts a list of nodes in place so that nodes on the longest remaining path through the graph come first.
+        :param nodes: list of Node instances.
+        :return:
+        """
+        if len(nodes) < 2:
+            return
+        self.updatePriorities()
+        priorities = self.priorities
+        nodes.sort(key=lambda node: priorities.get(node.ID, 0), reverse=True)
+
+    def updatePriorities(self, maxAge=1.):
+        """
+        Recomputes the priority of each node if the graph changed or if the priorities are older than maxAge.
+        The priority of a node is the estimated execution time of the longest path starting at that node. Estimates are
+        based on the average execution times recorded in Graph.RUNTIMES. Node classes that were not executed yet are
+        assumed to take the average time of all known classes.
+        :param maxAge: float; maximum age of the priorities in seconds.
+        :return:
+        """
+        now = time.time()
+        if now - self.prioritiesTime < maxAge:
+            return
+        self.prioritiesTime = now
+        runtimes = self.RUNTIMES
+        default = sum(runtimes.values()) / len(runtimes) if runtimes else 1.
+        successors = {node: {con.inputNode for con in self.connections[node]} for node in self.nodes.values()}
+        remaining = {node: len(succ) for node, succ in successors.items()}
+        predecessors = {node: {con.outputNode for con in self.reverseConnections[node]} for node in self.nodes.values()}
+        priorities = {}
+        stack = [node for node, count in remaining.items() if not count]
+        while stack:
+            node = stack.pop()
+            priorities[node.ID] = runtimes.get(node.__class__.__name__, default) + \
+                                  max([priorities[succ.ID] for succ in successors[node]], default=0)
+            for pred in predecessors[node]:
+                remaining[pred] -= 1
+                if not remaining[pred]:
+                    stack.append(pred)
+        # Nodes that are part of cycles, e.g. loop bodies, are estimated based on their already known successors.
+        for node in self.nodes.values():
+            if node.ID not in priorities:
+                priorities[node.ID] = runtimes.get(node.__class__.__name__, default) + \
+                                      max([priorities.get(succ.ID, 0) for succ in successors[node]], default=0)
+        self.priorities = priorities
+
+    def fuseChains(self):
+        """
+        Fuses nodes whose only incoming connection is the only outgoing connection of their predecessor.
+        A worker that executed the predecessor of a fused node executes the fused node right away instead of returning
+        it to the scheduler. Straight chains of nodes are therefore executed by a single worker without any scheduling
+        in between. Control nodes, polled nodes, coroutines and nodes using resources are never fused.
+        :return:
+        """
+        self.fusedSuccessors = {}
+        self.fusedPredecessors = {}
+        for node in self.nodes.values():
+            if not len(self.connections[node]) == 1 or isinstance(node, floppy.node.ControlNode):
+                continue
+            successor = next(iter(self.connections[node])).inputNode
+            if successor is node or not len(self.reverseConnections[successor]) == 1:
+                continue
+            if isinstance(successor, floppy.node.ControlNode) or successor.polled or successor.__resources__ or \
+                    inspect.iscoroutinefunction(successor.run):
+                continue
+            self.fusedSuccessors[node] = successor
+            self.fusedPredecessors[successor] = node
+
+    def pipeline(self, depth):
+        """
+        Turns the connected inputs of the graph's nodes into queued inputs holding up to 'depth' values.
+        Every node can then work on a new wave while its successors still work on the previous waves, e.g. all stages of
+        a chain of nodes fed by a source like the 'IncrementNode' run at the same time. The values of each connection
+        keep their order. Inputs that are queued already, control nodes and all nodes following a control node are
+        left unchanged since loops and branches rely on inputs being replaced.
+        :param depth: int; capacity of the queued inputs. If 0, the inputs are turned back into normal inputs.
+        :return:
+        """
+        for inp in self.pipelinedInputs:
+            inp.setQueue(0)
+        self.pipelineDepth = depth
+        self.pipelinedInputs = set()
+        if not depth:
+            return
+        controlled = self.getSuccessors([node for node in self.nodes.values()
+                                         if isinstance(node, floppy.node.ControlNode)])
+        for node in self.nodes.values():
+            if node in controlled:
+                continue
+            for con in self.getConnectionsTo(node):
+                inp = node.inputs[con['inputName']]
+                if not inp.queue:
+                    inp.setQueue(depth)
+                    self.pipelinedInputs.add(inp)
+
+    def isReserved(self, node):
+        """
+        Returns True if the node must not be scheduled because it will be executed together with its running
+        predecessor.
+        :param node: Node instance.
+        :return: bool
+        """
+        predecessor = self.fusedPredecessors.get(node)
+        return predecessor is not None and predecessor.locked
+
+    def claimFusedSuccessor(self, node):
+        """
+        Locks the node fused with a node that was just executed if it is ready.
+        :param node: Node instance. The node must still be locked.
+        :return: the locked successor or None.
+        """
+        successor = self.fusedSuccessors.get(node)
+        if successor is None or (successor.stateless and isinstance(self.executor, ProcessPool)):
+            return None
+        if successor.locked or not successor.check():
+            return None
+        successor.lock()
+        self.runningNodes.append(successor.ID)
+        return successor
+
+    @classmethod
+    def acquireResources(cls, node):
+        """
+        Reserves all resources declared by a node's class. Either all resources are reserved or none.
+        Nodes that cannot reserve their resources are remembered and pushed onto their graph's ready queue once a
+        resource is released again.
+        :param node: Node instance.
+        :return: True if the resources were reserved and the node may be executed.
+        """
+        if not node.__resources__:
+            return True
+        with cls.resourceLock:
+            for name, limit in node.__resources__.items():
+                if cls.RESOURCES.get(name, 0) >= limit:
+                    if node not in cls.RESOURCEWAITING:
+                        cls.RESOURCEWAITING.append(node)
+                    return False
+            for name in node.__resources__.keys():
+                cls.RESOURCES[name] = cls.RESOURCES.get(name, 0) + 1
+        return True
+
+    @classmethod
+    def releaseResources(cls, node):
+        """
+        Releases the resources reserved by acquireResources and wakes up all nodes waiting for a resource.
+        :param node: Node instance.
+        :return:
+        """
+        if not node.__resources__:
+            return
+        with cls.resourceLock:
+            for name in node.__resources__.keys():
+                cls.RESOURCES[name] -= 1
+            waiting = cls.RESOURCEWAITING
+            cls.RESOURCEWAITING = []
+        for waitingNode in waiting:
+            waitingNode.graph.readyQueue.push(waitingNode)
+
+    @classmethod
+    def recordRuntime(cls, node, runtime):
+        """
+        Updates the average execution time of a node's class.
+        :param node: Node instance.
+        :param runtime: float; execution time in seconds.
+        :return:
+        """
+        name = node.__class__.__name__
+        try:
+            cls.RUNTIMES[name] = .8 * cls.RUNTIMES[name] + .2 * runtime
+        except KeyError:
+            cls.RUNTIMES[name] = runtime
+
+    def cancelNode(self, node, reason='cancelled', execution=None):
+        """
+        Cancels a queued or running node.
+        A running node is asked to stop and the processes it started with Node.popen() are killed. Its locks and
+        resources are released immediately, even if run() never returns, and a NodePool worker stuck in the node is
+        replaced by a new one. The outputs of the cancelled execution are discarded and the node's successors are not
+        executed.
+        :param node: Node instance.
+        :param reason: str reported by the interpreter's status, e.g. 'cancelled' or 'timeout'.
+        :param execution: if given, the node is only cancelled if this execution is still running.
+        :return: True if the node was cancelled.
+        """
+        executor = self.executor.fallback if isinstance(self.executor, ProcessPool) else self.executor
+        task = executor.remove(node) if execution is None and isinstance(executor, NodePool) else None
+        if task:
+            # Queued nodes never acquired their runLock.
+            done = task[-1]
+            node.unlock()
+            Graph.releaseResources(node)
+        elif node.claimExecution(execution):
+            done = node.executionDone
+            node.cancel()
+            if isinstance(executor, NodePool):
+                executor.replaceWorker(node)
+            node.unlock()
+            node.runLock.release()
+            Graph.releaseResources(node)
+        else:
+            return False
+        for inp in node.inputs.values():
+            floppy.node.Info.reset(inp, node.loopLevel)
+        print('Execution of node {} was cancelled: {}'.format(str(node), reason))
+        self.cancelledNodes.append((node.ID, reason))
+        if done:
+            done(node)
+        return True
+
+    def runBatch(self, nodes, cb=None):
+        """
+        Executes a list of locked nodes concurrently and blocks until all of them finished.
+        :param nodes: list of Node instances.
+        :param cb: callable that is called with the ID of each node that was executed successfully.
+        :return:
+        """
+        finished = Semaphore(0)
+        for node in nodes:
+            self.runNodePar(node, cb=cb, arg=node.ID, done=lambda node: finished.release())
+        for node in nodes:
+            finished.acquire()
+
+    def executeWith(self, executor, owner=None, interval=.05):
+        """
+        Executes the graph until no node is ready or running anymore, like selfExecute() but concurrently.
+        Ready nodes are submitted to the executor of another graph, e.g. the graph owning a SubGraph node, so that they
+        are interleaved with that graph's nodes. While waiting, the calling thread executes this graph's nodes that are
+        still queued in the executor itself. A worker pool can therefore not deadlock when all of its workers wait for
+        their sub graphs.
+        :param executor: NodePool, ProcessPool or None. Without an executor a new NodeThread is started for every node.
+        :param owner: Node instance executing the graph. If it is cancelled, all running nodes of the graph are
+        cancelled and NodeCancelled is raised.
+        :param interval: maximum time in seconds between checks of the owner's state.
+        :return:
+        """
+        self.executor = executor
+        pool = executor.fallback if isinstance(executor, ProcessPool) else executor
+        self.fuseChains()
+        self.readyQueue.pushAll(self.nodes.values())
+        while True:
+            if owner and owner.cancelEvent.is_set():
+                for nodeID in list(self.runningNodes):
+                    self.cancelNode(self.nodes[nodeID], 'cancelled with {}'.format(owner))
+                owner.checkCancelled()
+            readyNodes = []
+            for node in self.readyQueue.pop() + self.polledNodes:
+                if not node.locked and node.check() and not self.isReserved(node) and self.acquireResources(node):
+                    node.lock()
+                    readyNodes.append(node)
+            self.sortByPriority(readyNodes)
+            for node in readyNodes:
+                self.runNodePar(node)
+            if not readyNodes and not self.runningNodes and not len(self.readyQueue):
+                return
+            task = pool._take(lambda node: node.graph is self) if isinstance(pool, NodePool) else None
+            if task:
+                runNode(*task)
+            elif not readyNodes:
+                self.readyQueue.wait(interval)
+
+    def compileExecutionPlan(self):
+        """
+        Computes a static execution plan for graphs without control flow.
+        Each node is assigned to the level following the highest level of its predecessors. All nodes of one level
+        can be executed concurrently once all previous levels were executed.
+        :return: list of lists of Node instances, one list per level. None if the graph contains control nodes,
+        polled nodes, streaming nodes or cycles.
+        """
+        for node in self.nodes.values():
+            if isinstance(node, floppy.node.ControlNode) or node.polled or inspect.isgeneratorfunction(node.run):
+                return None
+        predecessors = {node: len({con.outputNode for con in self.reverseConnections[node]})
+                        for node in self.nodes.values()}
+        levels = []
+        level = [node for node, count in predecessors.items() if not count]
+        scheduled = 0
+        while level:
+            levels.append(level)
+            scheduled += len(level)
+            nextLevel = []
+            for node in level:
+                for successor in {con.inputNode for con in self.connections[node]}:
+                    predecessors[successor] -= 1
+                    if not predecessors[successor]:
+                        nextLevel.append(successor)
+            level = nextLevel
+        if scheduled < len(self.nodes):
+            return None
+        return levels
+
     # def testRun(self):
     #     if not self.runner:
     #         self.runner = Runner()
@@ -419,11 +778,11 @@ class Graph(object):
         :return:
         """
         # self.executedBuffer = []
-        self.rgiConnection.send('PAUSE', self.print)
+        self.sendToRunner('PAUSE', self.print)
         message = self.serialize()
         # msg = struct.pack('>I', len(message)) + message.encode('utf-8')
         # self.sendUpdate(data)
-        self.rgiConnection.send('UPDATE'+message, self.print)
+        self.sendToRunner('UPDATE'+message, self.print)
 
     def push2Runner(self):
         """
@@ -432,12 +791,12 @@ class Graph(object):
         """
         self.executedBuffer = []
         self.STOREDVALUES = {}
-        self.rgiConnection.send('PAUSE', self.print)
+        self.sendToRunner('PAUSE', self.print)
         # time.sleep(1)
         message = self.serialize()
         # msg = struct.pack('>I', len(message)) + message.encode('utf-8')
         # self.sendUpdate(data)
-        self.rgiConnection.send('PUSH'+message, self.print)
+        self.sendToRunner('PUSH'+message, self.print)
 
     def serialize(self):
         """
@@ -488,7 +847,7 @@ class Graph(object):
         Send PAUSE command to the graph interpreter.
         :return:
         """
-        self.rgiConnection.send('PAUSE', self.print)
+        self.sendToRunner('PAUSE', self.print)
         # sendCommand('PAUSE', self.cmdHost, self.cmdPort)
 
     def unpauseRunner(self):
@@ -496,7 +855,7 @@ class Graph(object):
         Send UNPAUSE command to the graph interpreter.
         :return:
         """
-        self.rgiConnection.send('UNPAUSE', self.print)
+        self.sendToRunner('UNPAUSE', self.print)
         # sendCommand('UNPAUSE', self.cmdHost, self.cmdPort)
 
     def stepRunner(self):
@@ -504,7 +863,7 @@ class Graph(object):
         Send Step command to the graph interpreter causing it to execute one node and then reenter the PAUSED state.
         :return:
         """
-        self.rgiConnection.send('STEP', self.print)
+        self.sendToRunner('STEP', self.print)
 
     def gotoRunner(self, nextID):
         """
@@ -512,10 +871,18 @@ class Graph(object):
         :param nextID:
         :return:
         """
-        self.rgiConnection.send('GOTO1', self.print)
+        self.sendToRunner('GOTO1', self.print)
 
     def dropGraph(self):
-        self.rgiConnection.send('DROP', self.print)
+        self.sendToRunner('DROP', self.print)
+
+    def cancelRunnerNode(self, nodeID):
+        """
+        Send CANCEL command to the graph interpreter causing it to cancel a queued or running node.
+        :param nodeID: ID of the node.
+        :return:
+        """
+        self.sendToRunner('CANCEL{}'.format(nodeID), self.print)
 
     def setStatus(self, status):
         self.status = json.loads(status[10:])
@@ -523,7 +890,7 @@ class Graph(object):
     def requestRemoteStatus(self):
         if self.connected:
             try:
-                self.rgiConnection.send('STATUS***{}'.format(self._requestReport), self.setStatus)
+                self.sendToRunner('STATUS***{}'.format(self._requestReport), self.setStatus)
                 # status = json.loads(status[10:])
             except BrokenPipeError:
                 self.connected = False
@@ -588,6 +955,7 @@ class Graph(object):
                 restoredNode.inputs[input[0]].setDefault(input[-1])
             for output in outputs:
                 restoredNode.outputs[output[0]].setDefault(output[-1])
+            restoredNode.applyQueueSettings(nodeData.get('queues', {}))
         for id, nodeData in saveState:
             id = int(id)
             # print(nodeData['class'])
@@ -616,40 +984,73 @@ class Graph(object):
                     except KeyError:
                         print('Warning: Could not create connection due to missing node.')
 
+        self.appliedState = self.canonicalState(saveState) if reuseIDs else {}
         self.update()
         return idMap
 
+    def reset(self, saveState, idMap):
+        """
+        Returns a graph created by loadState() to the state it had right after loading, e.g. for executing it again.
+        :param saveState: save state passed to loadState().
+        :param idMap: dictionary returned by loadState().
+        :return:
+        """
+        for id, nodeData in saveState:
+            try:
+                node = self.nodes[idMap[int(id)]]
+            except KeyError:
+                continue
+            node.reset()
+            for input in nodeData['inputs']:
+                node.inputs[input[0]].setDefault(input[-1])
+            for output in nodeData['outputs']:
+                node.outputs[output[0]].setDefault(output[-1])
+        self.returnValue = -1
+        self.returnPriority = -1
+        self.returningNode = None
+        self.executedBuffer = []
+        self.runningNodes = []
+        self.STOREDVALUES = {}
+        self.INPUTVALUES = {}
+        self.DYNAMICINPUTVALUES = {}
+        self.executor = None
+        self.readyQueue.pop()
+
     def updateState(self, data, reuseIDs=False):
         """
         Updates the current the Graph instance with the json representation of another, similar Graph instance.
         New Node instances are created for Nodes in the json data that are not already present.
         Also, all connections are removed and re-instanciated based on the provided json data.
+
+        Only nodes whose data changed since the last update and all of their successors are reset and will be executed
+        again. Outputs of the other nodes are kept and passed on to the reset nodes.
         :param data:
         :return:
         """
         self.connections = {key: set() for key in self.connections.keys()}
         self.reverseConnections = {key: set() for key in self.reverseConnections.keys()}
+        self.prioritiesTime = 0
+        state = self.canonicalState(data)
+        changed = {nodeID for nodeID, nodeState in state.items() if not self.appliedState.get(nodeID) == nodeState}
+        self.appliedState = state
         idMap = {}
+        nodeData = {}
         removeNodes = set(self.nodes.keys())
-        for id, nodeData in data:
+        for id, thisData in data:
             useID = id if reuseIDs else False
             idMap[int(id)] = int(id)
             if not int(id) in self.nodes.keys():
-                restoredNode = self.spawnNode(floppy.node.NODECLASSES[nodeData['class']],
-                                              position=nodeData['position'], silent=True, useID=useID)
+                restoredNode = self.spawnNode(floppy.node.NODECLASSES[thisData['class']],
+                                              position=thisData['position'], silent=True, useID=useID)
                 thisNode = restoredNode
+                changed.add(thisNode.ID)
             else:
                 thisNode = self.nodes[int(id)]
             removeNodes.discard(thisNode.ID)
-            inputs = nodeData['inputs']
-            outputs = nodeData['outputs']
-            for input in inputs:
-                thisNode.inputs[input[0]].setDefault(input[-1])
-            for output in outputs:
-                thisNode.outputs[output[0]].setDefault(output[-1])
-        for id, nodeData in data:
+            nodeData[thisNode] = thisData
+        for id, thisData in data:
             id = int(id)
-            for inputName, outputID in nodeData['inputConnections'].items():
+            for inputName, outputID in thisData['inputConnections'].items():
                 if inputName == 'Control':
                     continue
                 outputNode, outputName = outputID.split(':O')
@@ -657,7 +1058,7 @@ class Graph(object):
                 # print(id, nodeData['inputConnections'], outputNode, outputName)
                 self.connect(str(outputNode), outputName, str(idMap[id]), inputName)
 
-            for outputName, inputIDs in nodeData['outputConnections'].items():
+            for outputName, inputIDs in thisData['outputConnections'].items():
                 for inputID in inputIDs:
                     if not 'Control' in inputID:
                         continue
@@ -667,9 +1068,78 @@ class Graph(object):
                     self.connect(str(idMap[id]), outputName, str(inputNode), inputName)
         for nodeID in removeNodes:
             self.deleteNode(self.nodes[nodeID])
+        dirty = self.getSuccessors([self.nodes[nodeID] for nodeID in changed if nodeID in self.nodes])
+        hidden = {dependency for node in dirty for dependency in node.hiddenDependencies()} - dirty
+        while hidden:
+            dirty |= self.getSuccessors(hidden)
+            hidden = {dependency for node in dirty for dependency in node.hiddenDependencies()} - dirty
+        for node in dirty:
+            node.reset()
+            for input in nodeData[node]['inputs']:
+                node.inputs[input[0]].setDefault(input[-1])
+            for output in nodeData[node]['outputs']:
+                node.outputs[output[0]].setDefault(output[-1])
+            node.applyQueueSettings(nodeData[node].get('queues', {}))
+        for node in dirty:
+            for con in self.getConnectionsTo(node):
+                if con['outputNode'] in dirty or con['inputName'] == 'Control':
+                    continue
+                output = con['outputNode'].outputs[con['outputName']]
+                if output.valueSet:
+                    node.setInput(con['inputName'], output.value, override=True)
+        if dirty:
+            self.returnValue = -1
+            self.returnPriority = -1
+            self.returningNode = None
+        self.dirtyNodes = dirty
         self.update()
         return idMap
 
+    def getSuccessors(self, nodes):
+        """
+        Returns the given nodes and all nodes that can be reached from them by following connections.
+        :param nodes: iterable of Node instances.
+        :return: set of Node instances.
+        """
+        successors = set()
+        front = list(nodes)
+        while front:
+            node = front.pop()
+            if node in successors:
+                continue
+            successors.add(node)
+            front += [con['inputNode'] for con in self.getConnectionsFrom(node)]
+        return successors
+
+    @staticmethod
+    def canonicalState(data):
+        """
+        Returns a comparable representation of every node in a json representation created by Graph.toJson().
+        The representation includes everything affecting a node's results, i.e. its class, the default values, the
+        capacities of queued inputs and the connections to its inputs, but not its position.
+        :param data: list of (nodeID, nodeData) tuples.
+        :return: Dictionary mapping node IDs to strings.
+        """
+        incoming = {int(id): [] for id, nodeData in data}
+        for id, nodeData in data:
+            for inputName, outputID in nodeData['inputConnections'].items():
+                if not inputName == 'Control':
+                    incoming[int(id)].append((inputName, outputID))
+            for outputName, inputIDs in nodeData['outputConnections'].items():
+                for inputID in inputIDs:
+                    inputNode, inputName = inputID.split(':I')
+                    if inputName == 'Control' and int(inputNode) in incoming:
+                        incoming[int(inputNode)].append((inputName, '{}:O{}'.format(id, outputName)))
+        state = {}
+        for id, nodeData in data:
+            state[int(id)] = json.dumps([nodeData['class'],
+                                         [(input[0], input[-1]) for input in nodeData['inputs']],
+                                         [(output[0], output[-1]) for output in nodeData['outputs']],
+                                         sorted(incoming[int(id)]),
+                                         nodeData.get('subgraph'),
+                                         nodeData.get('queues', {})], sort_keys=True, default=str)
+        return state
+
     def loadDict(self, saveState):
         """
         Reconstruct a Graph instance from a JSON string representation created by the Graph.toJson() method.
@@ -686,6 +1156,7 @@ class Graph(object):
                 restoredNode.inputs[input[0]].setDefault(input[-1])
             for output in outputs:
                 restoredNode.outputs[output[0]].setDefault(output[-1])
+            restoredNode.applyQueueSettings(nodeData.get('queues', {}))
         for id, nodeData in saveState.items():
             id = int(id)
             for inputName, outputID in nodeData['inputConnections'].items():
@@ -762,6 +1233,7 @@ class Graph(object):
         for thisConn in conns:
             self.connections[node].remove(thisConn)
             self.reverseConnections[thisConn.inputNode].remove(thisConn)
+        self.prioritiesTime = 0
 
     def deleteNode(self, node):
         """
@@ -774,42 +1246,549 @@ class Graph(object):
         for out in node.outputs.values():
             self.removeConnection(out.ID)
         del self.nodes[node.ID]
+        if node in self.polledNodes:
+            self.polledNodes.remove(node)
+        self.readyQueue.discard(node)
 
     def configureInterpreter(self, options):
         try:
-            self.rgiConnection.send('CONFIGURE{}'.format(json.dumps(options)), print)
+            self.sendToRunner('CONFIGURE{}'.format(json.dumps(options)), print)
         except AttributeError:
             print('No Connection. Cannot send configuration.')
 
 
+def runNode(node, cb=None, arg=None, done=None):
+    """
+    Runs a locked node, notifies its successors and unlocks it again.
+    This is the execution logic shared by the NodeThread class and the workers of a NodePool.
+    Nodes fused with the node by Graph.fuseChains() are executed right afterwards in the calling thread.
+    :param node: Node instance.
+    :param cb: callable that is called with 'arg' after the node was executed successfully. For fused nodes it is called
+    with the fused node's ID.
+    :param arg: argument passed to 'cb'.
+    :param done: callable that is called with the node after the execution finished, successfully or not. It is not
+    called for fused nodes.
+    :return: True if the node was executed successfully.
+    """
+    while True:
+        node.runLock.acquire()
+        execution = node.startExecution(done)
+        if node.timeout:
+            getWatchdog().watch(node, execution)
+        t = time.time()
+        successor = None
+        try:
+            node.runSync()
+        except Exception as a:
+            # The node was cancelled if the execution cannot be claimed. Its locks are released already.
+            if not node.claimExecution(execution):
+                return False
+            failNode(node, a)
+            success = False
+        else:
+            if not node.claimExecution(execution):
+                return False
+            Graph.recordRuntime(node, time.time() - t)
+            successor = finishNode(node, cb, arg, fuse=True)
+            success = True
+        if done:
+            done(node)
+        if not successor:
+            return success
+        node, arg, done = successor, successor.ID, None
+        worker = current_thread()
+        if isinstance(worker, NodeWorker):
+            worker.node = node
+
+
+def finishNode(node, cb=None, arg=None, fuse=False):
+    """
+    Notifies the successors of a node that was executed and releases the node's locks.
+    :param node: Node instance. The node's runLock must be acquired.
+    :param cb: callable that is called with 'arg' after the successors were notified.
+    :param arg: argument passed to 'cb'.
+    :param fuse: if True, the node fused with the node is locked before the node is unlocked if it is ready.
+    :return: the locked fused node that must be executed by the caller or None.
+    """
+    node.notify()
+    if cb:
+        cb(arg)
+    successor = node.graph.claimFusedSuccessor(node) if fuse else None
+    node.unlock()
+    node.runLock.release()
+    Graph.releaseResources(node)
+    node.graph.readyQueue.push(node)
+    # Producers waiting for a free slot in a queued input of the node or streaming into it may be ready again.
+    for con in node.graph.getConnectionsTo(node):
+        if node.inputs[con['inputName']].queue or con['outputNode'].stream is not None:
+            node.graph.readyQueue.push(con['outputNode'])
+    if not successor and node in node.graph.fusedSuccessors:
+        # The fused node was skipped by the scheduler while the node was running.
+        node.graph.readyQueue.push(node.graph.fusedSuccessors[node])
+    return successor
+
+
+def failNode(node, error):
+    """
+    Reports a failed node execution and releases the node's locks.
+    :param node: Node instance. The node's runLock must be acquired.
+    :param error: Exception raised during execution.
+    :return:
+    """
+    print('Something bad happened in when executing {}.'.format(str(node)))
+    print(error)
+    node.unlock()
+    node.runLock.release()
+    Graph.releaseResources(node)
+
+
+def initDetached():
+    """
+    Initializer of ProcessPool workers. Imports the custom nodes, printing warnings about broken modules to stderr so
+    that the output of the interpreter is not mixed with them.
+    :return: None
+    """
+    from floppy.runner import loadCustomNodes
+    with contextlib.redirect_stdout(sys.stderr):
+        loadCustomNodes()
+
+
+def runDetached(className, inputs):
+    """
+    Runs a node of the given class outside of the graph it belongs to and returns the values of its outputs.
+    Used by ProcessPool workers for executing stateless nodes.
+    :param className: name of the node's class.
+    :param inputs: dictionary created by Node.packInputs().
+    :return: tuple of the dictionaries created by Node.packOutputs() and Node.packInputs() after execution.
+    """
+    node = floppy.node.NODECLASSES[className](0, Graph())
+    node.unpackInputs(inputs)
+    node.runSync()
+    return node.packOutputs(), node.packInputs()
+
+
+def runPooled(className, inputs):
+    """
+    Like runDetached() but also returns the text printed by the node. Used by ProcessPool workers, whose output would
+    otherwise bypass the interpreter's sys.stdout.
+    :param className: name of the node's class.
+    :param inputs: dictionary created by Node.packInputs().
+    :return: tuple returned by runDetached() extended by the printed text.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = runDetached(className, inputs)
+    return result + (output.getvalue(),)
+
+
+def finishDetached(node, cb, arg, done, result, t, key=None, execution=None):
+    """
+    Writes the result of a node executed by runDetached() back to the node and notifies its successors.
+    Used for nodes executed by a ProcessPool or by another interpreter.
+    :param node: Node instance. The node's runLock must be acquired.
+    :param cb: callable that is called with 'arg' after the successors were notified.
+    :param arg: argument passed to 'cb'.
+    :param done: callable that is called with the node afterwards.
+    :param result: tuple returned by runDetached().
+    :param t: time the execution started.
+    :param key: result cache key of the node or None.
+    :param execution: value returned by Node.startExecution(). The result is discarded if the execution was cancelled.
+    :return:
+    """
+    if execution is not None and not node.claimExecution(execution):
+        return
+    Graph.recordRuntime(node, time.time() - t)
+    outputs, inputs = result
+    if key:
+        floppy.cache.RESULTCACHE.put(key, outputs)
+    try:
+        node.unpackOutputs(outputs)
+        for name, state in inputs.items():
+            node.inputs[name].usedDefault = state[-1]
+        finishNode(node, cb, arg)
+    except Exception as a:
+        print('Something bad happened in when notifying successors of {}.'.format(str(node)))
+        print(a)
+    if done:
+        done(node)
+
+
+def failDetached(node, done, error, execution=None):
+    """
+    Reports a failed execution of a node executed by runDetached().
+    :param node: Node instance. The node's runLock must be acquired.
+    :param done: callable that is called with the node afterwards.
+    :param error: Exception raised during execution.
+    :param execution: value returned by Node.startExecution(). Nothing is reported if the execution was cancelled.
+    :return:
+    """
+    if execution is not None and not node.claimExecution(execution):
+        return
+    failNode(node, error)
+    if done:
+        done(node)
+
+
 class NodeThread(Thread):
 
-    def __init__(self, node, cb, arg):
+    def __init__(self, node, cb, arg, done=None):
         # node.lock()
         self.node = node
         self.cb = cb
 
         self.arg = arg
+        self.done = done
         super(NodeThread, self).__init__()
         self.daemon = True
         self.start()
 
     def run(self):
         super(NodeThread, self).run()
+        runNode(self.node, self.cb, self.arg, self.done)
+
+
+class NodePool(object):
+    """
+    Executor running nodes on a fixed number of worker threads.
+    In contrast to starting a NodeThread for every node, the number of threads and therefore the memory footprint of
+    the interpreter stays constant, no matter how many nodes become ready at the same time.
+    """
+    def __init__(self, workers):
+        self.tasks = PriorityQueue()
+        self.counter = count()
+        self.workers = [NodeWorker(self.tasks) for i in range(workers)]
+
+    def __len__(self):
+        return len(self.workers)
+
+    def submit(self, node, cb=None, arg=None, done=None, priority=0):
+        """
+        Queues a locked node for execution by the next idle worker. Queued nodes with a higher priority are executed
+        first.
+        :param node: Node instance.
+        :param cb: callable that is called with 'arg' after the node was executed successfully.
+        :param arg: argument passed to 'cb'.
+        :param done: callable that is called with the node after the execution finished, successfully or not.
+        :param priority: float; priority of the node.
+        :return:
+        """
+        self.tasks.put((-priority, next(self.counter), (node, cb, arg, done)))
+
+    def idleWorkers(self):
+        """
+        Returns the number of workers that are neither running a node nor have a node waiting for them.
+        :return: int
+        """
+        return max(0, sum(not worker.busy for worker in self.workers) - self.tasks.qsize())
+
+    def stealable(self):
+        """
+        Returns the number of queued stateless nodes.
+        :return: int
+        """
+        with self.tasks.mutex:
+            return sum(1 for task in self.tasks.queue if task[2] and task[2][0].stateless)
+
+    def steal(self):
+        """
+        Removes the queued stateless node with the lowest priority from the queue, e.g. for executing it in another
+        interpreter. The caller is responsible for finishing the node.
+        :return: tuple of the arguments passed to submit() except priority or None if no stateless node is queued.
+        """
+        return self._take(lambda node: node.stateless)
+
+    def remove(self, node):
+        """
+        Removes a node from the queue if it is still waiting for a worker.
+        :param node: Node instance.
+        :return: tuple of the arguments passed to submit() except priority or None if the node is not queued.
+        """
+        return self._take(lambda queued: queued is node)
+
+    def _take(self, match):
+        with self.tasks.mutex:
+            tasks = [task for task in self.tasks.queue if task[2] and match(task[2][0])]
+            if not tasks:
+                return None
+            task = max(tasks)
+            self.tasks.queue.remove(task)
+            heapq.heapify(self.tasks.queue)
+        return task[2]
+
+    def replaceWorker(self, node):
+        """
+        Replaces the worker running a node by a new worker. The old worker terminates once the node returns.
+        Used for cancelled nodes that do not return in time.
+        :param node: Node instance.
+        :return:
+        """
+        for worker in self.workers:
+            if worker.node is node:
+                worker.retired = True
+                self.workers.remove(worker)
+                self.workers.append(NodeWorker(self.tasks))
+                return
+
+    def shutdown(self):
+        """
+        Terminates all workers after the already queued nodes were executed.
+        :return:
+        """
+        for worker in self.workers:
+            self.tasks.put((float('inf'), next(self.counter), None))
+        self.workers = []
+
+
+class ProcessPool(object):
+    """
+    Executor running stateless nodes in a pool of worker processes.
+    The input values of a node are pickled and sent to a worker process that runs a fresh instance of the node's class.
+    The resulting output values are written back to the node's outputs before its successors are notified.
+    Nodes that are not flagged as stateless are passed on to the fallback executor or run in a new NodeThread.
+    The workers are started by a fork server, or spawned where that is not available, and import the custom nodes
+    themselves. Forking the interpreter would copy locks held by its other threads, e.g. NodePool workers, the Watchdog
+    or the AsyncLoop, into workers that could then deadlock on them.
+    """
+    def __init__(self, processes=0, fallback=None):
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(processes if processes else None, initializer=initDetached)
+        self.fallback = fallback
+
+    def submit(self, node, cb=None, arg=None, done=None, priority=0):
+        key = node.cacheKey() if node.cacheable else None
+        if not node.stateless or key in floppy.cache.RESULTCACHE:
+            if self.fallback:
+                self.fallback.submit(node, cb, arg, done, priority)
+            else:
+                NodeThread(node, cb, arg, done)
+            return
+        node.runLock.acquire()
+        execution = node.startExecution(done)
         try:
-            self.node.runLock.acquire()
-            self.node.run()
+            inputs = node.packInputs()
         except Exception as a:
-            print('Something bad happened in when executing {}.'.format(str(self.node)))
-            print(a)
-            self.node.unlock()
-            self.node.runLock.release()
+            self._fail(node, done, a, execution)
             return
-        self.node.notify()
-        if self.cb:
-            self.cb(self.arg)
-        self.node.unlock()
-        self.node.runLock.release()
+        if node.timeout:
+            getWatchdog().watch(node, execution)
+        t = time.time()
+        self.pool.apply_async(runPooled, (node.__class__.__name__, inputs),
+                              callback=lambda result: self._finish(node, cb, arg, done, result, t, key, execution),
+                              error_callback=lambda error: self._fail(node, done, error, execution))
+
+    def _finish(self, node, cb, arg, done, result, t, key=None, execution=None):
+        outputs, inputs, printed = result
+        if printed:
+            sys.stdout.write(printed)
+        finishDetached(node, cb, arg, done, (outputs, inputs), t, key, execution)
+
+    def _fail(self, node, done, error, execution=None):
+        failDetached(node, done, error, execution)
+
+    def shutdown(self):
+        self.pool.close()
+
+
+class AsyncLoop(Thread):
+    """
+    Thread running an asyncio event loop for executing nodes with an 'async def run()' method.
+    Any number of such nodes can wait for subprocesses or I/O concurrently without occupying a thread each. Like
+    Node.runSync(), the loop restores the outputs of cacheable nodes from the caches instead of running them.
+    Use getAsyncLoop() to access the loop shared by all graphs of the interpreter.
+    """
+    def __init__(self):
+        super(AsyncLoop, self).__init__()
+        self.loop = asyncio.new_event_loop()
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        if sys.version_info < (3, 12) and hasattr(os, 'pidfd_open'):
+            # Older versions default to a child watcher starting one thread per subprocess.
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        self.loop.run_forever()
+
+    def submit(self, node, cb=None, arg=None, done=None, priority=0):
+        asyncio.run_coroutine_threadsafe(self._runNode(node, cb, arg, done), self.loop)
+
+    async def _runNode(self, node, cb, arg, done):
+        if not node.runLock.acquire(False):
+            # Waiting for the lock in the loop's thread would stall all other coroutine nodes.
+            await self.loop.run_in_executor(None, node.runLock.acquire)
+        execution = node.startExecution(done)
+        node.asyncTask = asyncio.current_task()
+        if node.timeout:
+            getWatchdog().watch(node, execution)
+        t = time.time()
+        try:
+            if node.cacheable or node.diskCacheable:
+                # Hashing the inputs and reading the disk cache must not block the loop either.
+                key, restored = await self.loop.run_in_executor(None, node.restoreCachedOutputs)
+            else:
+                key, restored = None, False
+            if not restored:
+                await node.run()
+                if key:
+                    await self.loop.run_in_executor(None, node.storeCachedOutputs, key)
+        except (Exception, asyncio.CancelledError) as a:
+            if not node.claimExecution(execution):
+                return
+            failNode(node, a)
+        else:
+            if not node.claimExecution(execution):
+                return
+            Graph.recordRuntime(node, time.time() - t)
+            finishNode(node, cb, arg)
+        if done:
+            done(node)
+
+
+_asyncLoop = None
+_asyncLoopLock = Lock()
+
+
+def getAsyncLoop():
+    """
+    Returns the AsyncLoop instance shared by all graphs. The loop is started on first use.
+    :return: AsyncLoop instance.
+    """
+    global _asyncLoop
+    with _asyncLoopLock:
+        if not _asyncLoop:
+            _asyncLoop = AsyncLoop()
+    return _asyncLoop
+
+
+class Watchdog(Thread):
+    """
+    Thread cancelling nodes that run longer than the 'timeout' of their class.
+    Use getWatchdog() to access the thread shared by all graphs of the interpreter.
+    """
+    def __init__(self, interval=.05):
+        super(Watchdog, self).__init__()
+        self.interval = interval
+        self.deadlines = []
+        self.counter = count()
+        self.lock = Lock()
+        self.daemon = True
+        self.start()
+
+    def watch(self, node, execution):
+        """
+        Cancels an execution of a node if it is still running after the node's timeout.
+        :param node: Node instance.
+        :param execution: value returned by Node.startExecution().
+        :return:
+        """
+        with self.lock:
+            heapq.heappush(self.deadlines, (time.time() + node.timeout, next(self.counter), node, execution))
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            expired = []
+            with self.lock:
+                while self.deadlines and self.deadlines[0][0] <= now:
+                    expired.append(heapq.heappop(self.deadlines))
+            for deadline, i, node, execution in expired:
+                node.graph.cancelNode(node, 'timeout', execution)
+
+
+_watchdog = None
+_watchdogLock = Lock()
+
+
+def getWatchdog():
+    """
+    Returns the interpreter's Watchdog and starts it if necessary.
+    :return: Watchdog instance.
+    """
+    global _watchdog
+    with _watchdogLock:
+        if not _watchdog:
+            _watchdog = Watchdog()
+    return _watchdog
+
+
+class NodeWorker(Thread):
+    """
+    Worker thread of a NodePool.
+    """
+    def __init__(self, tasks):
+        super(NodeWorker, self).__init__()
+        self.tasks = tasks
+        self.busy = False
+        self.node = None
+        self.retired = False
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        while not self.retired:
+            priority, i, task = self.tasks.get()
+            if task is None:
+                return
+            self.busy = True
+            self.node = task[0]
+            runNode(*task)
+            self.node = None
+            self.busy = False
+
+
+class ReadyQueue(object):
+    """
+    Collection of nodes that need to be checked by the event driven scheduler.
+    A node is pushed whenever one of its inputs is set or after it finished running. The scheduler pops all queued
+    nodes at once and only checks those instead of polling every node of the graph.
+    """
+    def __init__(self):
+        self.nodes = OrderedDict()
+        self.lock = Lock()
+        self.event = Event()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def push(self, node):
+        with self.lock:
+            self.nodes[node.ID] = node
+        self.event.set()
+
+    def pushAll(self, nodes):
+        with self.lock:
+            for node in nodes:
+                self.nodes[node.ID] = node
+        self.event.set()
+
+    def discard(self, node):
+        with self.lock:
+            self.nodes.pop(node.ID, None)
+
+    def pop(self):
+        """
+        Empties the queue.
+        :return: list of all queued nodes in the order they were pushed.
+        """
+        with self.lock:
+            nodes = list(self.nodes.values())
+            self.nodes.clear()
+            self.event.clear()
+        return nodes
+
+    def wait(self, timeout):
+        """
+        Blocks until a node is pushed or the timeout expired.
+        :param timeout: float; maximum waiting time in seconds.
+        :return: True if a node was pushed.
+        """
+        return self.event.wait(timeout)
 
 
 class Connection(object):
@@ -1,9 +1,16 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from copy import copy
+from operator import attrgetter
 from floppy.FloppyTypes import Type, MetaType
-from threading import Lock
+from threading import Lock, Event
 from os.path import isfile
+import subprocess
+import asyncio
+import inspect
+import signal
+import os
 import floppy.graph
+import floppy.cache
 
 NODECLASSES = {}
 _NODECLASSES = {}
@@ -18,6 +25,26 @@ class InputAlreadySet(Exception):
     pass
 
 
+class NodeCancelled(Exception):
+    pass
+
+
+def killProcess(process):
+    """
+    Kills a process started by Node.popen() together with all processes it started, e.g. the program started by a
+    shell.
+    :param process: subprocess.Popen instance.
+    :return:
+    """
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
 def abstractNode(cls: type):
     """
     Removes a Node class from the NODECLASSES dictionary and then returns the class object.
@@ -42,30 +69,120 @@ def Tag(*args, **kwargs):
     pass
 
 
-class Info(object):
+def Resource(*args, **kwargs):
+    pass
+
+
+class InfoSpec(object):
     """
-    Class for handling all information related to both inputs and outputs.
+    Declaration of an input or output. A spec is shared by the infos of all instances of a node class and must not be
+    modified. Use replace() to derive a spec with different values.
     """
-    def __init__(self, name, varType, hints=None, default='', select=None, owner=False, list=False, optional=False):
-        self.multiConn = 0
-        self.multiCounter = 0
+    __slots__ = ('name', 'varType', 'hints', 'select', 'list', 'optional')
+
+    def __init__(self, name, varType, hints, select, list, optional):
         self.name = name
-        self.connected = False
         self.varType = varType
+        self.hints = hints
+        self.select = select
+        self.list = list
         self.optional = optional
+
+    def replace(self, **fields):
+        """
+        Returns a copy of the spec with some of its fields replaced.
+        :param fields: new values of the fields given by their name.
+        :return: InfoSpec instance.
+        """
+        values = {field: getattr(self, field) for field in InfoSpec.__slots__}
+        values.update(fields)
+        return InfoSpec(**values)
+
+
+def specField(field):
+    """
+    Returns a property giving access to a field of an info's spec. Setting the property replaces the info's spec
+    instead of modifying the spec shared with other infos.
+    :param field: name of the InfoSpec field.
+    :return: property
+    """
+    def setField(self, value):
+        self.spec = self.spec.replace(**{field: value})
+    return property(attrgetter('spec.' + field), setField)
+
+
+class Info(object):
+    """
+    Class for handling all information related to both inputs and outputs.
+    Nodes copy the infos of their class. The declaration of the input or output is kept in an InfoSpec shared by all
+    copies, so only the state of the input or output is stored per node.
+    """
+    __slots__ = ('spec', 'owner', 'default', 'value', 'valueSet', 'loopLevel', 'usedDefault', 'multiConn',
+                 'multiCounter', 'connected', 'pure', 'queue', 'buffer', 'streamEnded', 'wave', '_ID')
+
+    name = specField('name')
+    varType = specField('varType')
+    hints = specField('hints')
+    select = specField('select')
+    list = specField('list')
+    optional = specField('optional')
+
+    def __init__(self, name, varType, hints=None, default='', select=None, owner=False, list=False, optional=False,
+                 queue=0):
         if not hints:
-            self.hints = [varType.__name__]
+            hints = [varType.__name__]
         else:
-            self.hints = [varType.__name__] + hints
+            hints = [varType.__name__] + hints
+        self.spec = InfoSpec(name, varType, hints, select, list, optional)
+        self.multiConn = 0
+        self.multiCounter = 0
+        self.connected = False
         self.default = default
         self.valueSet = False
         self.value = None
-        self.select = select
         self.owner = owner
-        self.list = list
         self.loopLevel = 0
         self.usedDefault = False
         self.pure = 0
+        # Capacity of a queued input. Values arriving while the input is set wait in 'buffer' instead of replacing it.
+        self.queue = queue
+        self.buffer = None
+        # Set by Node.endStream() once the node streaming values into this input finished its stream.
+        self.streamEnded = False
+        # Wave of the current value. See Node.nextWave().
+        self.wave = None
+        # ID of the pin the info belongs to if it differs from the ID derived from the owning node. See Pin.
+        self._ID = None
+
+    def __copy__(self):
+        info = object.__new__(self.__class__)
+        info.spec = self.spec
+        info.owner = self.owner
+        info.default = self.default
+        info.value = self.value
+        info.valueSet = self.valueSet
+        info.loopLevel = self.loopLevel
+        info.usedDefault = self.usedDefault
+        info.multiConn = self.multiConn
+        info.multiCounter = self.multiCounter
+        info.connected = self.connected
+        info.pure = self.pure
+        info.queue = self.queue
+        info.buffer = self.buffer
+        info.streamEnded = self.streamEnded
+        info.wave = self.wave
+        info._ID = self._ID
+        return info
+
+    @property
+    def ID(self):
+        if self._ID is not None:
+            return self._ID
+        return '{}:{}{}'.format(self.owner.ID, self.prefix, self.spec.name)
+
+    @ID.setter
+    def ID(self, pinID):
+        self._ID = pinID
 
     def setOwner(self, owner):
         self.owner = owner
@@ -95,13 +212,29 @@ class Info(object):
             # print('Not resetting Input {} because owing node has higher node\n'
             #       'level than the node setting the Input: {}vs.{}'.format(self.name, nodeLoopLevel, self.loopLevel))
             return
+        if self.queue and self.owner:
+            # Producers append to the queue while holding the owning node's input lock.
+            with self.owner.inputLock:
+                if self.buffer and not force:
+                    self.value, self.loopLevel, self.wave = self.buffer.popleft()
+                    return
+                self.buffer = None
+                self._clear()
+        else:
+            self._clear()
+
+    def _clear(self):
         self.default = None
         self.valueSet = False
         self.value = None
         self.multiCounter = 0
+        self.wave = None
 
 
 class InputInfo(Info):
+    __slots__ = ()
+    prefix = 'I'
+
     def __call__(self, noException=False):
         if self.valueSet:
             if not self.varType == object:
@@ -127,11 +260,18 @@ class InputInfo(Info):
             else:
                 raise InputNotAvailable('Input not set for node.')
 
-    def set(self, value, override=False, loopLevel=0):
+    def set(self, value, override=False, loopLevel=0, wave=None):
+        if self.valueSet and self.queue:
+            # Queued inputs never drop values. Their producers are not executed while the queue is full.
+            if self.buffer is None:
+                self.buffer = deque()
+            self.buffer.append((value, loopLevel, wave))
+            return
         if self.valueSet and not override:
             raise InputAlreadySet('Input \'{}\' of node \'{}\' is already set.'.format(self.name, str(self.owner)))
         self.value = value
         self.valueSet = True
+        self.wave = wave
         if not self.name == 'Control':
             self.loopLevel = loopLevel
         else:
@@ -140,6 +280,21 @@ class InputInfo(Info):
     def setPure(self):
         self.pure = 1
 
+    def setQueue(self, capacity):
+        """
+        Turns the input into a queued input holding up to 'capacity' values or back into a normal input if 0.
+        :param capacity: int
+        :return:
+        """
+        self.queue = capacity
+
+    def isFull(self):
+        """
+        Returns True if the input is a queued input holding as many values as its capacity.
+        :return: bool
+        """
+        return bool(self.queue) and self.valueSet + len(self.buffer or ()) >= self.queue
+
     def setConnected(self, value: bool):
         self.connected = value
 
@@ -199,6 +354,9 @@ class InputInfo(Info):
 
 
 class OutputInfo(Info):
+    __slots__ = ()
+    prefix = 'O'
+
     def __call__(self, value):
         try:
             value.__FloppyType__ = self.varType
@@ -217,23 +375,29 @@ class MetaNode(type):
     """
     inputs = []
     outputs = []
+    resources = []
 
     @classmethod
     def __prepare__(metacls, name, bases):
         MetaNode.inputs = []
         MetaNode.outputs = []
         MetaNode.tags = []
+        MetaNode.resources = []
         return {'Input': MetaNode.addInput,
                 'input': MetaNode.addInput,
                 'Output': MetaNode.addOutput,
                 'output': MetaNode.addOutput,
                 'Tag': MetaNode.addTag,
-                'tag': MetaNode.addTag,}
+                'tag': MetaNode.addTag,
+                'Resource': MetaNode.addResource,
+                'resource': MetaNode.addResource}
 
     def addTag(*args):
         for arg in args:
             MetaNode.tags.append(arg)
 
+    def addResource(name: str, limit=1):
+        MetaNode.resources.append((name, limit))
 
     def addInput(name: str,
                  varType: object,
@@ -241,14 +405,16 @@ class MetaNode(type):
                  default='',
                  select=None,
                  list=False,
-                 optional=False):
+                 optional=False,
+                 queue=0):
         MetaNode.inputs.append({'name': name,
                                 'varType': varType,
                                 'hints': hints,
                                 'default': default,
                                 'select': select,
                                 'list': list,
-                                'optional': optional})
+                                'optional': optional,
+                                'queue': queue})
 
     def addOutput(name: str,
                   varType: object,
@@ -282,6 +448,11 @@ class MetaNode(type):
         except AttributeError:
             result.__tags__ = []
 
+        try:
+            result.__resources__ = result.__bases__[0].__resources__.copy()
+        except AttributeError:
+            result.__resources__ = OrderedDict()
+
         for inp in MetaNode.inputs:
             result._addInput(data=inp, cls=result)
 
@@ -290,6 +461,15 @@ class MetaNode(type):
 
         for tag in MetaNode.tags:
             result._addTag(tag)
+
+        for name, limit in MetaNode.resources:
+            result.__resources__[name] = limit
+        MetaNode.resources = []
+        if inspect.isgeneratorfunction(getattr(result, 'run', None)):
+            # Streaming nodes keep their running generator between executions.
+            result.stateless = False
+            result.cacheable = False
+            result.diskCacheable = False
         return result
 
 @abstractNode
@@ -305,9 +485,45 @@ class Node(object, metaclass=MetaNode):
 
     To access the value of an input during the Node's 'run' method or 'check' method use
     'myNodeInstance._myStringInput'. An 'InputNotAvailable' Exception is raised is the input is not set yet.
+
+    Nodes competing for a limited resource, e.g. a program writing fixed file names into the working directory, can
+    declare that resource together with the maximum number of nodes using it at the same time:
+
+        class MyNode(Node):
+            Resource('myProgram', 2)
+
+    The parallel interpreter modes will never run more nodes using the same resource at once.
+
+    Nodes can stream values by yielding them from 'run()'. Every execution of the node advances the generator to the
+    next 'yield' and passes the current output values to the connected nodes. A value other than None that is yielded
+    is set to the node's first output. Once the generator is exhausted the connected inputs are flagged as
+    'streamEnded', e.g. for the 'Collect' node:
+
+        class MyNode(Node):
+            Input('FileName', str)
+            Output('Line', str)
+
+            def run(self):
+                with open(self._FileName) as fp:
+                    for line in fp:
+                        yield line
     """
     Input('TRIGGER', object, optional=True)
     Tag('Node')
+    # Set to True if check() depends on anything else than the node's inputs, e.g. a timer or a file.
+    # The event driven scheduler checks polled nodes on every step instead of waiting for an input to change.
+    polled = False
+    # Set to True if run() only depends on the node's inputs and neither reads nor modifies the node instance or the
+    # graph. Stateless nodes may be executed in a separate process in the 'Process' execution mode.
+    stateless = False
+    # Set to True if the outputs are a deterministic function of the input values. The outputs of cacheable nodes are
+    # stored in a result cache and restored without calling run() when the node receives the same inputs again.
+    cacheable = False
+    # Like 'cacheable' but the outputs are stored on disk in the interpreter's work directory. Meant for nodes running
+    # expensive external programs. Override toolVersion() to invalidate the entries when the program changes.
+    diskCacheable = False
+    # Maximum execution time in seconds. The parallel interpreter modes cancel nodes running longer than that.
+    timeout = None
 
     def __init__(self, nodeID, graph):
         self.waitForAllControlls = False
@@ -320,27 +536,36 @@ class Node(object, metaclass=MetaNode):
         self.subgraph = 'main'
         self.ID = nodeID
         self.buffered = False
+        # State of the current execution used for cancelling it. See startExecution() and claimExecution().
+        self.execution = 0
+        self.running = False
+        self.executionLock = Lock()
+        self.executionDone = None
+        self.cancelEvent = Event()
+        self.childProcesses = []
+        self.asyncTask = None
+        # Generator returned by a streaming run() until it is exhausted. See runSync().
+        self.stream = None
+        self.streamEnded = False
+        # Number of waves started by the node. See nextWave().
+        self.waves = 0
         self.inputs = OrderedDict()
         self.outputs = OrderedDict()
         self.outputBuffer = {}
         self.inputPins = OrderedDict()
         self.outputPins = OrderedDict()
-        for i, inp in enumerate(self.__inputs__.values()):
+        for name, inp in self.__inputs__.items():
             inp = copy(inp)
-            inp.setOwner(self)
-            inpID = '{}:I{}'.format(self.ID, inp.name)
-            newPin = Pin(inpID, inp, self)
-            self.inputPins[inp.name] = newPin
-            self.inputs[inp.name] = inp
+            inp.owner = self
+            self.inputPins[name] = Pin(None, inp, self)
+            self.inputs[name] = inp
 
-        for i, out in enumerate(self.__outputs__.values()):
+        for name, out in self.__outputs__.items():
             out = copy(out)
-            out.setOwner(self)
-            outID = '{}:O{}'.format(self.ID, out.name)
-            newPin = Pin(outID, out, self)
-            self.outputPins[out.name] = newPin
-            self.outputs[out.name] = out
-            self.outputBuffer[out.name] = None
+            out.owner = self
+            self.outputPins[name] = Pin(None, out, self)
+            self.outputs[name] = out
+            self.outputBuffer[name] = None
         if not self.inputs.keys():
             raise AttributeError('Nodes without any input are not valid.')
         if len(self.inputs.keys()) == 2:
@@ -389,12 +614,264 @@ class Node(object, metaclass=MetaNode):
         # print('===============\nExecuting node {}'.format(self))
         # print('{} is loopLevel ='.format(str(self)), self.loopLevel,'\n================')
 
+    def runSync(self):
+        """
+        Runs the node in the calling thread.
+        Cacheable nodes first try to restore their outputs from the result cache or the disk cache.
+        If run() is defined as a coroutine ('async def run(self)'), it is run to completion on a new event loop. The
+        parallel interpreter modes instead run such nodes on a shared event loop.
+        If run() is a generator, every call advances it to the next yielded value.
+        :return: None
+        """
+        if self.stream is not None:
+            return self.nextItem()
+        key, restored = self.restoreCachedOutputs()
+        if restored:
+            return
+        result = self.run()
+        if inspect.isgenerator(result):
+            self.stream = result
+            self.streamEnded = False
+            return self.nextItem()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        self.storeCachedOutputs(key)
+
+    def restoreCachedOutputs(self):
+        """
+        Restores the outputs of a cacheable node from the result cache or the disk cache.
+        :return: tuple (key, restored). Pass 'key' to storeCachedOutputs() after running the node. It is None if the
+        node is not cached. 'restored' is True if the outputs were found in a cache and the node must not run.
+        """
+        memory = self.cacheable and floppy.cache.RESULTCACHE.size
+        disk = self.diskCacheable and floppy.cache.DISKCACHE.root
+        key = self.cacheKey() if memory or disk else None
+        if not key:
+            return None, False
+        outputs = floppy.cache.RESULTCACHE.get(key) if memory else None
+        if outputs is None and disk:
+            outputs = floppy.cache.DISKCACHE.get(key)
+        if outputs is None:
+            return key, False
+        self.unpackOutputs(outputs)
+        return key, True
+
+    def storeCachedOutputs(self, key):
+        """
+        Stores the outputs of a node that just ran in the caches it uses.
+        :param key: cache key returned by restoreCachedOutputs().
+        :return: None
+        """
+        if not key:
+            return
+        outputs = self.packOutputs()
+        if self.cacheable and floppy.cache.RESULTCACHE.size:
+            floppy.cache.RESULTCACHE.put(key, outputs)
+        if self.diskCacheable and floppy.cache.DISKCACHE.root:
+            floppy.cache.DISKCACHE.put(key, outputs)
+
+    def nextItem(self):
+        """
+        Advances the generator returned by a streaming run() to the next yielded value.
+        :return: None
+        """
+        try:
+            value = next(self.stream)
+        except StopIteration:
+            self.stream = None
+            self.streamEnded = True
+            return
+        except Exception:
+            self.stream = None
+            raise
+        if value is not None:
+            next(iter(self.outputs.values()))(value)
+
+    def endStream(self, inputName):
+        """
+        Flags an input as having received the last value of a stream.
+        :param inputName: str representing the name of the input.
+        :return: None
+        """
+        with self.inputLock:
+            self.inputs[inputName].streamEnded = True
+        self.graph.readyQueue.push(self)
+        self.passStreamEnd()
+
+    def passStreamEnd(self):
+        """
+        Passes the end of a stream on to the connected nodes once all values received before were used.
+        Override this in nodes consuming streams, e.g. the 'Collect' node.
+        :return: None
+        """
+        if self.stream is not None or not any(inp.streamEnded for inp in self.inputs.values()):
+            return
+        with self.inputLock:
+            ended = [inp for inp in self.inputs.values() if inp.streamEnded and not inp.valueSet and not inp.buffer]
+            for inp in ended:
+                inp.streamEnded = False
+        if ended:
+            for con in self.graph.getConnectionsFrom(self):
+                con['inputNode'].endStream(con['inputName'])
+
+    def startExecution(self, done=None):
+        """
+        Marks the beginning of a new execution of the node. Called by the executors after acquiring the node's runLock.
+        :param done: 'done' callback of the executor. It is called by Graph.cancelNode() if the execution is cancelled.
+        :return: int identifying the execution. Pass it to claimExecution() once run() returned.
+        """
+        with self.executionLock:
+            self.execution += 1
+            self.running = True
+            self.executionDone = done
+            self.cancelEvent.clear()
+            self.childProcesses = []
+            self.asyncTask = None
+            return self.execution
+
+    def claimExecution(self, execution=None):
+        """
+        Ends the current execution. Either the executor finishing the node or Graph.cancelNode() succeeds, never both.
+        :param execution: value returned by startExecution(). If None, the current execution is claimed.
+        :return: True if the execution was still running and is now ended by the caller.
+        """
+        with self.executionLock:
+            if not self.running or (execution is not None and not execution == self.execution):
+                return False
+            self.running = False
+            return True
+
+    def cancel(self):
+        """
+        Asks run() to stop and kills all processes started with popen() or popenAsync().
+        run() methods that take long without waiting for a child process should call checkCancelled() regularly or
+        use sleep() instead of time.sleep().
+        :return: None
+        """
+        self.cancelEvent.set()
+        for process in self.childProcesses:
+            killProcess(process)
+        if self.asyncTask:
+            self.asyncTask.get_loop().call_soon_threadsafe(self.asyncTask.cancel)
+
+    def checkCancelled(self):
+        """
+        Raises NodeCancelled if the current execution was cancelled.
+        :return: None
+        """
+        if self.cancelEvent.is_set():
+            raise NodeCancelled('Execution of node {} was cancelled.'.format(self))
+
+    def sleep(self, seconds):
+        """
+        Waits for the given number of seconds and raises NodeCancelled if the execution is cancelled meanwhile.
+        :param seconds: float
+        :return: None
+        """
+        if self.cancelEvent.wait(seconds):
+            raise NodeCancelled('Execution of node {} was cancelled.'.format(self))
+
+    def popen(self, *args, **kwargs):
+        """
+        Starts a child process like subprocess.Popen(). The process and all processes it starts are killed when the
+        execution is cancelled.
+        :return: subprocess.Popen instance.
+        """
+        if os.name == 'posix':
+            kwargs.setdefault('start_new_session', True)
+        process = subprocess.Popen(*args, **kwargs)
+        self.childProcesses.append(process)
+        if self.cancelEvent.is_set():
+            killProcess(process)
+        return process
+
+    async def popenAsync(self, *args, shell=False, **kwargs):
+        """
+        Starts a child process like asyncio.create_subprocess_exec() or, if 'shell' is True, like
+        asyncio.create_subprocess_shell(). Use this instead of popen() in coroutine run() methods. The process and all
+        processes it starts are killed when the execution is cancelled.
+        :return: asyncio.subprocess.Process instance.
+        """
+        if os.name == 'posix':
+            kwargs.setdefault('start_new_session', True)
+        if shell:
+            process = await asyncio.create_subprocess_shell(*args, **kwargs)
+        else:
+            process = await asyncio.create_subprocess_exec(*args, **kwargs)
+        self.childProcesses.append(process)
+        if self.cancelEvent.is_set():
+            killProcess(process)
+        return process
+
+    def cacheKey(self):
+        """
+        Returns a key identifying the node's class, the version returned by toolVersion() and the current values of its
+        inputs.
+        Override this if the outputs depend on anything else that can be hashed, e.g. the content of an input file.
+        :return: str or None if the node cannot be cached with its current inputs.
+        """
+        values = [(name, inp(True)) for name, inp in self.inputs.items() if not name == 'TRIGGER']
+        # The qualified name keeps equally named node classes of different modules apart.
+        cls = self.__class__
+        return floppy.cache.hashValues('{}.{}'.format(cls.__module__, cls.__qualname__), self.toolVersion(), values)
+
+    def toolVersion(self):
+        """
+        Returns a string identifying the version of the external program used by the node.
+        Override this in nodes with 'diskCacheable = True' e.g. by returning floppy.cache.programVersion('myProgram').
+        :return: str
+        """
+        return ''
+
+    def hiddenDependencies(self):
+        """
+        Returns nodes the node depends on without being connected to them, e.g. nodes storing values read by this node.
+        These nodes are executed again together with this node after the graph was updated.
+        :return: list of Node instances.
+        """
+        return []
+
+    def reset(self):
+        """
+        Returns the node to the state it had before its first execution. Default values of the inputs are kept.
+        Override this if the node keeps additional state between executions.
+        :return: None
+        """
+        for inp in self.inputs.values():
+            inp.valueSet = False
+            inp.value = None
+            inp.multiCounter = 0
+            inp.loopLevel = 0
+            inp.usedDefault = False
+            inp.buffer = None
+            inp.streamEnded = False
+            inp.wave = None
+            if inp.pure:
+                inp.pure = 1
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.streamEnded = False
+        self.waves = 0
+        for out in self.outputs.values():
+            out.valueSet = False
+            out.value = None
+        self.loopLevel = 0
+        self.buffered = False
+
     def notify(self):
         """
         Manage the node's state after execution and set input values of subsequent nodes.
+        The inputs of a streaming node are kept until its stream ended.
         :return: None
         :rtype: None
         """
+        if self.streamEnded:
+            for con in self.graph.getConnectionsFrom(self):
+                con['inputNode'].endStream(con['inputName'])
+            [Info.reset(inp, self.loopLevel) for inp in self.inputs.values()]
+            return
+        wave = self.nextWave() if self.tracksWaves() else None
         for con in self.graph.getConnectionsFrom(self):
             self.buffered = False
             outputName = con['outputName']
@@ -402,17 +879,22 @@ class Node(object, metaclass=MetaNode):
             nextInput = con['inputName']
             # nextNode.prepare()
             if self.outputs[outputName].valueSet:
-                nextNode.setInput(nextInput, self.outputs[outputName].value, override=True, loopLevel=self.loopLevel)
+                nextNode.setInput(nextInput, self.outputs[outputName].value, override=True, loopLevel=self.loopLevel,
+                                  wave=wave)
             else:
-                nextNode.setInput(nextInput, self.outputs[outputName].default, override=True, loopLevel=self.loopLevel)
+                nextNode.setInput(nextInput, self.outputs[outputName].default, override=True, loopLevel=self.loopLevel,
+                                  wave=wave)
         if not self.graph.getConnectionsFrom(self):
             self.buffered = True
             for out in self.outputs.values():
                 self.outputBuffer[out.name] = out.value
+        if self.stream is not None:
+            return
         [Info.reset(inp, self.loopLevel) for inp in self.inputs.values()]
+        self.passStreamEnd()
         # print(self, [inp.name for inp in self.inputs.values()])
 
-    def setInput(self, inputName, value, override=False, loopLevel=False):
+    def setInput(self, inputName, value, override=False, loopLevel=False, wave=None):
         """
         Sets the value of an input.
         :param inputName: str representing the name of the input.
@@ -420,13 +902,57 @@ class Node(object, metaclass=MetaNode):
         :param override: boolean specifying whether the input should be overridden if it was set already.
         :param looped: boolean. Set to True if the input is set by a looped node. If True, the node becomes a looped
         node itself. Defaults to False.
+        :param wave: wave of the value as returned by the producing node's nextWave() or None.
         :return: None
         """
         with self.inputLock:
             self.loopLevel = max([self.loopLevel, loopLevel])
-            self.inputs[inputName].set(value, override=override, loopLevel=loopLevel)
+            self.inputs[inputName].set(value, override=override, loopLevel=loopLevel, wave=wave)
+        self.graph.readyQueue.push(self)
         # print('%%%%%%%%%%%%%%%%', str(self), inputName, value)
 
+    def packInputs(self):
+        """
+        Returns the state of all inputs as a picklable dictionary.
+        :return: dictionary mapping input names to (valueSet, value, default, connected, loopLevel, usedDefault) tuples.
+        """
+        return {name: (inp.valueSet, inp.value, inp.default, inp.connected, inp.loopLevel, inp.usedDefault)
+                for name, inp in self.inputs.items()}
+
+    def unpackInputs(self, inputs):
+        """
+        Restores the state of the inputs from a dictionary created by packInputs().
+        :param inputs: dictionary mapping input names to (valueSet, value, default, connected, loopLevel, usedDefault)
+        tuples.
+        :return: None
+        """
+        for name, (valueSet, value, default, connected, loopLevel, usedDefault) in inputs.items():
+            inp = self.inputs[name]
+            inp.valueSet = valueSet
+            inp.value = value
+            inp.default = default
+            inp.connected = connected
+            inp.loopLevel = loopLevel
+            inp.usedDefault = usedDefault
+
+    def packOutputs(self):
+        """
+        Returns the state of all outputs as a picklable dictionary.
+        :return: dictionary mapping output names to (valueSet, value) tuples.
+        """
+        return {name: (out.valueSet, out.value) for name, out in self.outputs.items()}
+
+    def unpackOutputs(self, outputs):
+        """
+        Restores the state of the outputs from a dictionary created by packOutputs().
+        :param outputs: dictionary mapping output names to (valueSet, value) tuples.
+        :return: None
+        """
+        for name, (valueSet, value) in outputs.items():
+            out = self.outputs[name]
+            out.valueSet = valueSet
+            out.value = value
+
     def check(self) -> bool:
         """
         Checks whether all prerequisites for executing the node instance are met.
@@ -438,9 +964,14 @@ class Node(object, metaclass=MetaNode):
         # print(self)
         if self.locked:
             return False
+        if self.isBlocked():
+            return False
+        if self.stream is not None:
+            return True
         if self.buffered and self.outputs.keys():
             # print('Node {} has buffered output. Trying to notify outgoing connections.'.format(self))
             return self.notify()
+        self.alignWaves()
         for inp in self.inputs.values():
             if not inp.isAvailable():
                 if inp.optional and not inp.connected:
@@ -450,6 +981,77 @@ class Node(object, metaclass=MetaNode):
         # print('        {}: ready.'.format(str(self)))
         return True
 
+    def tracksWaves(self):
+        """
+        Returns True if the node passes waves on with its values, i.e. if the graph is pipelined or the node has queued
+        inputs. Waves are only needed for aligning the values of queued inputs.
+        :return: bool
+        """
+        if self.graph.pipelineDepth:
+            return True
+        for inp in self.inputs.values():
+            if inp.queue:
+                return True
+        return False
+
+    def nextWave(self):
+        """
+        Returns the wave of the values passed on by the current execution.
+        A wave maps the IDs of the nodes it originates from to the number of the originating node's execution. A node
+        without inputs carrying a wave and every value yielded by a streaming node start a new wave. Other nodes pass
+        on the waves of their inputs.
+        :return: dictionary mapping node IDs to ints.
+        """
+        wave = {}
+        for inp in self.inputs.values():
+            if inp.valueSet and inp.wave:
+                for origin, count in inp.wave.items():
+                    if count > wave.get(origin, 0):
+                        wave[origin] = count
+        if not wave or self.stream is not None:
+            self.waves += 1
+            wave[self.ID] = self.waves
+        return wave
+
+    def alignWaves(self):
+        """
+        Drops the current value of each queued input that belongs to an older wave than the current value of another
+        queued input of the same origin. Values are queued in the order of their waves, so the value of the same wave
+        will never arrive at the other input, e.g. because a Switch did not pass the wave on.
+        :return: None
+        """
+        if not self.tracksWaves():
+            return
+        queued = [inp for inp in self.inputs.values() if inp.queue and inp.valueSet and inp.wave]
+        while len(queued) > 1:
+            latest = {}
+            for inp in queued:
+                for origin, count in inp.wave.items():
+                    if count > latest.get(origin, 0):
+                        latest[origin] = count
+            stale = [inp for inp in queued if any(count < latest[origin] for origin, count in inp.wave.items())]
+            if not stale:
+                return
+            for inp in stale:
+                Info.reset(inp, inp.loopLevel)
+            for con in self.graph.getConnectionsTo(self):
+                if self.inputs[con['inputName']] in stale:
+                    self.graph.readyQueue.push(con['outputNode'])
+            queued = [inp for inp in queued if inp.valueSet and inp.wave]
+
+    def isBlocked(self):
+        """
+        Returns True if a queued input connected to one of the node's outputs is full. Custom check() implementations
+        of nodes feeding queued inputs should return False in that case.
+        While streaming, inputs that are not queued block the node until their current value was used.
+        :return: bool
+        """
+        for con in self.graph.getConnectionsFrom(self):
+            inp = con['inputNode'].inputs[con['inputName']]
+            if inp.isFull() or (self.stream is not None and inp.valueSet and not inp.queue):
+                return True
+        return False
+
     def report(self):
         """
         Creates and returns a dictionary encoding the current state of the Node instance.
@@ -610,8 +1212,36 @@ class Node(object, metaclass=MetaNode):
                 'outputs': [(outputName, out.varType.__name__, out.value, out.default)
                             for outputName, out in self.outputs.items()],
                 'outputConnections': outputConns,
+                'queues': self.queueSettings(),
                 'subgraph': self.subgraph}
 
+    def queueSettings(self):
+        """
+        Returns the capacities of the node's inputs that differ from the capacities declared by the node class.
+        Inputs queued by Graph.pipeline() are ignored.
+        :return: dictionary mapping input names to ints.
+        """
+        declared = self.__inputs__
+        return {name: inp.queue for name, inp in self.inputs.items()
+                if not inp.queue == (declared[name].queue if name in declared else 0) and
+                not inp in self.graph.pipelinedInputs}
+
+    def applyQueueSettings(self, queues):
+        """
+        Sets the capacities of the node's inputs to those returned by queueSettings() and resets all other inputs to
+        the capacity declared by the node class. Inputs queued by Graph.pipeline() keep their capacity unless it is
+        given.
+        :param queues: dictionary mapping input names to ints.
+        :return: None
+        """
+        declared = self.__inputs__
+        for name, inp in self.inputs.items():
+            if name in queues:
+                inp.setQueue(queues[name])
+                self.graph.pipelinedInputs.discard(inp)
+            elif not inp in self.graph.pipelinedInputs:
+                inp.setQueue(declared[name].queue if name in declared else 0)
+
     @classmethod
     def matchHint(cls, text: str):
         return cls.matchInputHint(text) or cls.matchOutputHint(text) or cls.matchClassTag(text)
@@ -638,13 +1268,22 @@ class Node(object, metaclass=MetaNode):
 class Pin(object):
     """
     Class for storing all information required to represent a input/output pin.
+    The pin's ID and name are those of its info.
     """
+    __slots__ = ('info', 'node')
+
+    ID = property(attrgetter('info.ID'))
+    name = property(attrgetter('info.name'))
+
     def __init__(self, pinID, info, node):
-        self.ID = pinID
-        self.ID = pinID
-        self.name = info.name
+        """
+        :param pinID: str or None to derive the ID from the ID of the info's owner when it is needed.
+        :param info: InputInfo or OutputInfo instance.
+        :param node: Node instance.
+        """
+        if pinID is not None:
+            info.ID = pinID
         self.info = info
-        info.ID = pinID
         self.node = node
 
 
@@ -659,11 +1298,12 @@ class ProxyNode(Node):
         self.__proxies__ = {}
         self.__ready__ = {inp: False for inp in self.inputs.keys()}
 
-    def setInput(self, inputName, value, override=False, loopLevel=False):
+    def setInput(self, inputName, value, override=False, loopLevel=False, wave=None):
         self.loopLevel = max([self.loopLevel, loopLevel])
         proxy = self.__proxies__[inputName]
-        proxy.setInput(inputName, value, override, loopLevel)
+        proxy.setInput(inputName, value, override, loopLevel, wave)
         self.__ready__[inputName] = True
+        self.graph.readyQueue.push(self)
 
     def addProxyInput(self, name, output, input, varType):
         pass
@@ -716,6 +1356,10 @@ class Switch(ControlNode):
         super(Switch, self).__init__(*args, **kwargs)
         self.fresh = True
 
+    def reset(self):
+        super(Switch, self).reset()
+        self.fresh = True
+
     def check(self):
         if self.fresh:
             for inp in self.inputs.values():
@@ -962,6 +1606,20 @@ class ReadFile(Node):
         self._Content(c)
 
 
+class ReadLines(Node):
+    """
+    Node for streaming the lines of a file one by one.
+    """
+    Input('Name', str)
+    Output('Line', str)
+
+    def run(self):
+        super(ReadLines, self).run()
+        with open(self._Name, 'r') as fp:
+            for line in fp:
+                yield line.rstrip('\n')
+
+
 class WriteFile(Node):
     Input('Name', str)
     Input('Content', str)
@@ -989,12 +1647,18 @@ class ForLoop(ControlNode):
         self.done = False
         self.loopLevel = 0
 
-    def setInput(self, inputName, value, override=False, loopLevel=0):
+    def setInput(self, inputName, value, override=False, loopLevel=0, wave=None):
         if inputName == 'Control':
             loopLevel = self.loopLevel
-        super(ForLoop, self).setInput(inputName, value, override, loopLevel)
+        super(ForLoop, self).setInput(inputName, value, override, loopLevel, wave)
         # print('                                   XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX')
 
+    def reset(self):
+        super(ForLoop, self).reset()
+        self.fresh = True
+        self.counter = 0
+        self.done = False
+
     def check(self):
         if self.fresh:
             for inp in self.inputs.values():
@@ -1034,7 +1698,6 @@ class ForLoop(ControlNode):
                 nextInput = con['inputName']
                 nextNode.setInput(nextInput, self.outputs[outputName].value, loopLevel=self.loopLevel)
             # self.prepare()
-            self.fresh = True
             for inp in self.inputs.values():
                 if not inp.name == 'Iterations':
                     inp.reset()
@@ -1064,6 +1727,125 @@ class ForEach(ForLoop):
         self.counter += 1
 
 
+class ParallelForEach(ForLoop):
+    """
+    Variant of ForEach that executes the loop body for several list elements at once.
+    The loop body consists of all nodes between the 'ListElement' output and the 'Control' input. For every element a
+    copy of the body is created in a private graph and up to 'Width' copies are executed concurrently. The values
+    reaching the 'Control' input are collected in the order of the input list and set to the 'Final' output as a list.
+
+    The body nodes in the owning graph are never executed. Inputs of body nodes that are connected to nodes outside of
+    the body must be set before the loop starts and are copied to every copy of the body. The body must not contain
+    nodes relying on state shared between iterations.
+    """
+    Input('Start', object, list=True)
+    Input('Width', int, default=4)
+    Output('ListElement', object)
+    Tag('Parallel')
+
+    def setup(self):
+        self.body = None
+
+    def reset(self):
+        super(ParallelForEach, self).reset()
+        self.body = None
+
+    def check(self):
+        if not super(ParallelForEach, self).check():
+            return False
+        if self.fresh:
+            # The body is only searched once per execution of the loop, not on every check.
+            if self.body is None:
+                self.body = self.getBody()
+            for node in self.body:
+                for con in self.graph.getConnectionsTo(node):
+                    if con['outputNode'] in self.body or con['outputNode'] is self:
+                        continue
+                    if not node.inputs[con['inputName']].isAvailable():
+                        return False
+        return True
+
+    def run(self):
+        super(ForLoop, self).run()
+        self.fresh = False
+        body = self.body if self.body is not None else self.getBody()
+        self.body = None
+        elements = list(self._Start)
+        width = max(1, self._Width)
+        results = []
+        for i in range(0, len(elements), width):
+            # The copies of the body run on the executor of the owning graph, which enforces its worker limit and the
+            # resource limits of the body's nodes.
+            subGraph = floppy.graph.Graph()
+            copies = [self.copyBody(subGraph, body, element) for element in elements[i:i + width]]
+            executeSubGraph(self, subGraph, verbose=False)
+            results += [self.bodyResult(bodyCopies) for bodyCopies in copies]
+        self._Final(results)
+        self.done = True
+
+    def notify(self):
+        width = self.inputs['Width'].default
+        super(ParallelForEach, self).notify()
+        self.inputs['Width'].default = width
+
+    def getBody(self):
+        """
+        Returns all nodes reachable from the 'ListElement' output without passing through this node.
+        :return: list of Node instances.
+        """
+        body = []
+        front = [con['inputNode'] for con in self.graph.getConnectionsOfOutput(self.outputs['ListElement'])]
+        while front:
+            node = front.pop()
+            if node is self or node in body:
+                continue
+            body.append(node)
+            front += [con['inputNode'] for con in self.graph.getConnectionsFrom(node)]
+        return body
+
+    def copyBody(self, subGraph, body, element):
+        """
+        Adds a copy of the loop body for a single list element to a private graph.
+        :param subGraph: Graph instance receiving the copy.
+        :param body: list of Node instances as returned by getBody().
+        :param element: list element set to the inputs connected to 'ListElement'.
+        :return: dictionary mapping the body's nodes to their copies.
+        """
+        copies = {}
+        for node in body:
+            nodeCopy = subGraph.spawnNode(node.__class__, silent=True)
+            for name, inp in node.inputs.items():
+                nodeCopy.inputs[name].default = inp.default
+            copies[node] = nodeCopy
+        for node in body:
+            for con in self.graph.getConnectionsFrom(node):
+                if con['inputNode'] in copies:
+                    subGraph.connect(copies[node], con['outputName'], copies[con['inputNode']], con['inputName'])
+        for node in body:
+            for con in self.graph.getConnectionsTo(node):
+                if con['outputNode'] in copies:
+                    continue
+                if con['outputNode'] is self:
+                    value = element
+                else:
+                    value = node.inputs[con['inputName']]()
+                copies[node].setInput(con['inputName'], value, override=True)
+        return copies
+
+    def bodyResult(self, copies):
+        """
+        Returns the value an executed copy of the loop body would have set to the 'Control' input.
+        :param copies: dictionary returned by copyBody().
+        :return: object
+        """
+        result = None
+        for con in self.graph.getConnectionsOfControlInput(self.inputs['Control']):
+            output = copies[con['outputNode']].outputs[con['outputName']]
+            if output.valueSet:
+                result = output.value
+        return result
+
+
 class IsEqual(Node):
     """
     Sets output to object1 == object2.
@@ -1071,6 +1853,8 @@ class IsEqual(Node):
     Input('object1', object)
     Input('object2', object)
     Output('Equal', bool)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(IsEqual, self).run()
@@ -1124,6 +1908,8 @@ class Join(Node):
     Input('Str1', str)
     Input('Str2', str)
     Output('Joined', str)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(Join, self).run()
@@ -1186,11 +1972,56 @@ class GetValue(Node):
     def run(self):
         self._Value(self.graph.STOREDVALUES[self._Name])
 
+    def hiddenDependencies(self):
+        return [node for node in self.graph.nodes.values() if isinstance(node, SetValue)]
+
+
+class RemoteSend(Node):
+    """
+    Sends the value set to the 'Value' input to a node of a graph executed by another graph interpreter.
+    'Target' has the form 'host:port@sessionID#nodeID:inputName'. The value is sent with the interpreter's SETINPUT
+    command and must be picklable. The coordinator uses RemoteSend and RemoteReceive nodes to connect the partitions of
+    a graph executed by several interpreters.
+    """
+    Input('Value', object)
+    Input('Target', str)
+    Tag('Remote')
+
+    def run(self):
+        super(RemoteSend, self).run()
+        from floppy.coordinator import sendValue
+        sendValue(self._Target, self._Value, self.loopLevel)
+
+    def notify(self):
+        target = self.inputs['Target'].default
+        super(RemoteSend, self).notify()
+        self.inputs['Target'].default = target
+
+
+class RemoteReceive(Node):
+    """
+    Counterpart of RemoteSend. The 'Value' input is only set by the SETINPUT command of the graph interpreter and its
+    value is passed on to the 'Output' output.
+    """
+    Input('Value', object)
+    Output('Output', object)
+    Tag('Remote')
+
+    def setup(self):
+        # The input is fed from another interpreter and must never fall back to its default value.
+        self.inputs['Value'].setConnected(True)
+
+    def run(self):
+        super(RemoteReceive, self).run()
+        self._Output(self._Value)
+
 
 class Split(Node):
     Input('String', str)
     Input('Separator', str)
     Output('List', str, list=True)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(Split, self).run()
@@ -1200,12 +2031,60 @@ class Split(Node):
 class SplitLines(Node):
     Input('String', str)
     Output('List', str, list=True)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(SplitLines, self).run()
         self._List(self._String.splitlines())
 
 
+class Collect(Node):
+    """
+    Node for collecting the values streamed into 'Item' by a streaming node. The collected list is set to 'List' once
+    the stream ended.
+    """
+    Input('Item', object, queue=16)
+    Output('List', object, list=True)
+
+    def setup(self):
+        self.items = []
+        self.complete = False
+
+    def check(self):
+        if self.locked or self.isBlocked():
+            return False
+        with self.inputLock:
+            return self.inputs['Item'].valueSet or self.inputs['Item'].streamEnded
+
+    def run(self):
+        super(Collect, self).run()
+        inp = self.inputs['Item']
+        with self.inputLock:
+            if inp.valueSet:
+                self.items.append(inp.value)
+                return
+            inp.streamEnded = False
+        self._List(self.items)
+        self.items = []
+        self.complete = True
+
+    def notify(self):
+        if self.complete:
+            self.complete = False
+            super(Collect, self).notify()
+        else:
+            [Info.reset(inp, self.loopLevel) for inp in self.inputs.values()]
+
+    def passStreamEnd(self):
+        pass
+
+    def reset(self):
+        super(Collect, self).reset()
+        self.items = []
+        self.complete = False
+
+
 class ShowValues(Node):
     # Input('Trigger', object)
     Output('Output', object)
@@ -1253,6 +2132,8 @@ class AppendValue(Node):
 class ToString(Node):
     Input('Value', object)
     Output('String', str)
+    stateless = True
+    cacheable = True
 
     def run(self):
         super(ToString, self).run()
@@ -1318,6 +2199,8 @@ class SimpleReturn(Node):
 class Int2Float(Node):
     Input('Integer', int)
     Output('Float', float)
+    stateless = True
+    cacheable = True
 
     def run(self):
         self._Float(float(self._Integer))
@@ -1326,11 +2209,29 @@ class Int2Float(Node):
 class String2Float(Node):
     Input('String', str)
     Output('Float', float)
+    stateless = True
+    cacheable = True
 
     def run(self):
         self._Float(float(self._String))
 
 
+def executeSubGraph(node, subGraph, verbose=True):
+    """
+    Executes a private graph of a node, e.g. the sub graph of a SubGraph node or the loop bodies of a ParallelForEach
+    node, on the executor of the owning graph if the node itself is executed by one of the parallel interpreter modes.
+    Otherwise the graph is executed serially in the calling thread.
+    :param node: Node instance executing the sub graph.
+    :param subGraph: Graph instance.
+    :param verbose: if False, serial execution does not print the iterations.
+    :return:
+    """
+    if node.running:
+        subGraph.executeWith(node.graph.executor, owner=node)
+    else:
+        subGraph.selfExecute(verbose=verbose)
+
+
 @abstractNode
 class DynamicNode(Node):
     pass
@@ -1346,6 +2247,11 @@ class SubGraph(DynamicNode):
     a simple loop that will run until all nodes of the sub graph are executed or are un-reachable.
     This means that commands send to the interpreter will not affect the execution of the sub graph.
     From the point of view of the interpreter, the graph is just a node like any other.
+    In the parallel interpreter modes the nodes of the sub graph are executed concurrently by the interpreter's
+    executor, interleaved with the nodes of the owning graph. See Graph.executeWith().
+
+    Sub graphs are taken from floppy.cache.SUBGRAPHS. The graph file is only read again after it changed and graph
+    instances are reused by later executions.
     """
     Input('GraphName', str)
     Output('ReturnValue', object)
@@ -1357,15 +2263,17 @@ class SubGraph(DynamicNode):
         self.subGraph = floppy.graph.Graph()
 
     def run(self):
-        fileName = self._GraphName
-        self.subGraph.load(fileName)
-        for inp in self.iterInputs():
-            if inp.name == 'TRIGGER':
-                continue
-            self.subGraph.INPUTVALUES[inp.name] = inp.info()
-        self.subGraph.selfExecute()
-        self._ReturnValue((self.subGraph.returnValue, self.subGraph.returningNode))
-        
+        subGraph = floppy.cache.SUBGRAPHS.checkOut(self._GraphName)
+        try:
+            for inp in self.iterInputs():
+                if inp.name == 'TRIGGER':
+                    continue
+                subGraph.INPUTVALUES[inp.name] = inp.info()
+            executeSubGraph(self, subGraph)
+            self._ReturnValue((subGraph.returnValue, subGraph.returningNode))
+        finally:
+            floppy.cache.SUBGRAPHS.checkIn(subGraph)
+
     def iterInputs(self):
         yield from super(SubGraph, self).iterInputs()
         # for inp in self.INNERINPUTS:
@@ -1387,7 +2295,7 @@ class SubGraph(DynamicNode):
         self.innerNames = []
         if not isfile(fileName):
             return
-        self.subGraph.load(fileName)
+        self.subGraph.loadState(floppy.cache.SUBGRAPHS.getState(fileName))
         for node in self.subGraph.INPUTNODES:
             for inp in node.iterInputs():
                 if inp.name == 'TRIGGER':
@@ -1416,16 +2324,15 @@ class DynamicSubGraph(Node):
     Input('GraphName', str)
     Output('ReturnValue', object)
 
-    def setup(self):
-        self.subGraph = floppy.graph.Graph()
-
     def run(self):
-        fileName = self._GraphName
-        self.subGraph.load(fileName)
-        for name, value in self.graph.DYNAMICINPUTVALUES[self._GraphID].items():
-            self.subGraph.INPUTVALUES[name] = value
-        self.subGraph.selfExecute()
-        self._ReturnValue((self.subGraph.returnValue, self.subGraph.returningNode))
+        subGraph = floppy.cache.SUBGRAPHS.checkOut(self._GraphName)
+        try:
+            for name, value in self.graph.DYNAMICINPUTVALUES[self._GraphID].items():
+                subGraph.INPUTVALUES[name] = value
+            executeSubGraph(self, subGraph)
+            self._ReturnValue((subGraph.returnValue, subGraph.returningNode))
+        finally:
+            floppy.cache.SUBGRAPHS.checkIn(subGraph)
 
 
 class InputNode(Node):
@@ -5,13 +5,18 @@ Communication between the editor and the runner is realized via Sockets.
 The runner will report its status to the editor and the editor is able to send commands to the runner.
 """
 
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 import time
 from queue import Queue
 from socket import AF_INET, SOCK_STREAM, socket, SHUT_RDWR, timeout, SHUT_RDWR, SO_REUSEADDR, SOL_SOCKET
 import json
 import struct
 import logging
+import pickle
+import base64
+import os
+import uuid
+import floppy.cache
 
 logger = logging.getLogger('Floppy-Interpreter')
 logger.setLevel(logging.DEBUG)
@@ -33,20 +38,363 @@ port = 8079
 xLock = Lock()
 
 
-class Runner(object):
+class WorkerPools(object):
+    """
+    Owner of the worker pools used by one or more ExecutionThreads. ExecutionThreads never create or shut down pools,
+    they receive them through ExecutionThread.setExecutors().
+    The thread based NodePool executes all nodes, the ProcessPool executes stateless nodes in 'Process' mode and passes
+    all other nodes on to the NodePool.
+    """
+    def __init__(self, onChange=None):
+        """
+        :param onChange: callable without arguments called after the pools were replaced and before the old pools are
+        shut down. It is used to pass the new pools on to the ExecutionThreads using them.
+        """
+        self.executor = None
+        self.processPool = None
+        self.processes = 0
+        self.onChange = onChange
+
+    def setWorkers(self, workers):
+        """
+        Sets the number of worker threads.
+        :param workers: int; size of the worker pool. If 0, a new thread is started for every node.
+        :return:
+        """
+        from floppy.graph import NodePool
+        if (len(self.executor) if self.executor else 0) == workers:
+            return
+        oldExecutor = self.executor
+        self.executor = NodePool(workers) if workers else None
+        if self.processPool:
+            self.processPool.fallback = self.executor
+        self._changed()
+        if oldExecutor:
+            oldExecutor.shutdown()
+        logger.info('Number of workers set to {}'.format(workers))
+
+    def setProcesses(self, processes, create=False):
+        """
+        Sets the number of worker processes used in 'Process' mode.
+        :param processes: int; size of the process pool. If 0, the number of CPUs is used.
+        :param create: if True, the new process pool is started right away instead of on its first use.
+        :return:
+        """
+        if processes == self.processes:
+            return
+        self.processes = processes
+        oldPool = self.processPool
+        self.processPool = None
+        if create:
+            self.getProcessPool()
+        self._changed()
+        if oldPool:
+            oldPool.shutdown()
+        logger.info('Number of worker processes set to {}'.format(processes))
+
+    def getProcessPool(self):
+        """
+        Returns the process pool and starts it if necessary.
+        :return: ProcessPool instance.
+        """
+        from floppy.graph import ProcessPool
+        if not self.processPool:
+            self.processPool = ProcessPool(self.processes, fallback=self.executor)
+        return self.processPool
 
+    def assign(self, executionThread, mode):
+        """
+        Passes the pools needed for executing graphs in the given mode on to an ExecutionThread.
+        :param executionThread: ExecutionThread instance.
+        :param mode: name of the execution mode.
+        :return:
+        """
+        executionThread.setExecutors(self.executor, self.getProcessPool() if mode == 'Process' else self.processPool)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown()
+        if self.processPool:
+            self.processPool.shutdown()
+
+    def _changed(self):
+        if self.onChange:
+            self.onChange()
+
+
+class Runner(object):
+    """
+    Graph interpreter hosting any number of named sessions.
+    Every session has its own graph and ExecutionThread. All sessions share the worker pools and the loaded node
+    classes. Commands without a session ID address the default session ''.
+    """
     def __init__(self):
         logger.info('Creating new interpreter.')
+        self.pools = WorkerPools(self._updateSessions)
+        self.sessionLock = Lock()
+        self.sessions = {'': Session(self)}
+        # Peer interpreters idle workers take queued stateless nodes from and nodes lent to peers.
+        self.peers = []
+        self.lent = {}
+        self.lentLock = Lock()
+        self.lendTimeout = 600.
+        self.listener = Listener(self)
+        self.stealer = WorkStealer(self)
+
+    def join(self):
+        self.sessions[''].executionThread.join()
+
+    def getSession(self, sessionID='', create=False):
+        """
+        Returns the session with the given ID.
+        :param sessionID: str
+        :param create: if True, a new session is created if no session with that ID exists.
+        :return: Session instance or None.
+        """
+        with self.sessionLock:
+            if create and sessionID not in self.sessions:
+                self.sessions[sessionID] = Session(self, sessionID)
+            return self.sessions.get(sessionID)
+
+    def closeSession(self, sessionID):
+        """
+        Terminates a session's ExecutionThread and removes the session. The default session is only dropped.
+        :param sessionID: str
+        :return:
+        """
+        if not sessionID:
+            self.sessions[''].drop()
+            return
+        with self.sessionLock:
+            session = self.sessions.pop(sessionID, None)
+        if session:
+            session.kill()
+            logger.info('Closed session \'{}\'.'.format(sessionID))
+
+    def kill(self):
+        self.stealer.kill()
+        with self.sessionLock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.kill()
+
+    def getSessions(self):
+        """
+        Returns a short description of every session.
+        :return: dictionary mapping session IDs to dictionaries.
+        """
+        with self.sessionLock:
+            sessions = list(self.sessions.items())
+        report = {}
+        for sessionID, session in sessions:
+            graph = session.executionThread.graph
+            report[sessionID] = {'paused': session.executionThread.paused,
+                                 'mode': session.executionThread.mode,
+                                 'nodes': len(graph.nodes) if graph else 0,
+                                 'returnValue': graph.returnValue if graph else -1}
+        return report
+
+    def setWorkers(self, workers):
+        """
+        Sets the number of worker threads shared by all sessions.
+        :param workers: int; size of the worker pool. If 0, a new thread is started for every node.
+        :return:
+        """
+        self.pools.setWorkers(workers)
+
+    def setProcesses(self, processes):
+        """
+        Sets the number of worker processes shared by all sessions running in 'Process' mode.
+        :param processes: int; size of the process pool. If 0, the number of CPUs is used.
+        :return:
+        """
+        with self.sessionLock:
+            sessions = list(self.sessions.values())
+        self.pools.setProcesses(processes, create=any(session.executionThread.mode == 'Process' for session in sessions))
+
+    def getLoad(self):
+        """
+        Returns the number of queued nodes peers can take and the number of idle workers.
+        :return: dictionary.
+        """
+        executor = self.pools.executor
+        if not executor:
+            return {'queued': 0, 'idle': 0}
+        return {'queued': executor.stealable(), 'idle': executor.idleWorkers()}
+
+    def getCapacity(self):
+        """
+        Returns the number of nodes of peers this interpreter could execute right now without delaying its own nodes.
+        :return: int
+        """
+        if self.pools.executor:
+            return self.pools.executor.idleWorkers()
+        with self.sessionLock:
+            sessions = list(self.sessions.values())
+        if any(session.executionThread.graph and session.executionThread.graph.runningNodes for session in sessions):
+            return 0
+        return 1
+
+    def lendNode(self):
+        """
+        Removes a queued stateless node from the worker pool so that a peer can execute it.
+        :return: dictionary with the keys 'task', 'class' and 'inputs' or an empty dictionary if no node is queued.
+        """
+        from floppy.graph import failDetached, getWatchdog
+        executor = self.pools.executor
+        task = executor.steal() if executor else None
+        if not task:
+            return {}
+        node, cb, arg, done = task
+        node.runLock.acquire()
+        execution = node.startExecution(done)
+        try:
+            inputs = encodeValue(node.packInputs())
+        except Exception as a:
+            failDetached(node, done, a, execution)
+            return {}
+        if node.timeout:
+            getWatchdog().watch(node, execution)
+        key = node.cacheKey() if node.cacheable else None
+        taskID = uuid.uuid4().hex
+        with self.lentLock:
+            self.lent[taskID] = (task, time.time(), key, execution)
+        logger.debug('Lending node {} to a peer.'.format(node))
+        return {'task': taskID, 'class': node.__class__.__name__, 'inputs': inputs}
+
+    def acceptResult(self, data):
+        """
+        Finishes a node executed by a peer.
+        :param data: JSON string of a dictionary with the keys 'task' and either 'outputs', encoded with
+        encodeValue(), or 'error'.
+        :return: False if the node is unknown, e.g. because it was reclaimed already.
+        """
+        from floppy.graph import finishDetached, failDetached
+        data = json.loads(data)
+        with self.lentLock:
+            try:
+                (node, cb, arg, done), t, key, execution = self.lent.pop(data['task'])
+            except KeyError:
+                return False
+        if 'error' in data:
+            failDetached(node, done, RuntimeError('Peer failed: {}'.format(data['error'])), execution)
+        else:
+            finishDetached(node, cb, arg, done, decodeValue(data['outputs']), t, key, execution)
+        return True
+
+    def reclaimNodes(self):
+        """
+        Queues nodes lent to peers again if no result arrived within 'lendTimeout' seconds.
+        :return:
+        """
+        now = time.time()
+        with self.lentLock:
+            expired = [taskID for taskID, (task, t, key, execution) in self.lent.items()
+                       if now - t > self.lendTimeout]
+            expired = [self.lent.pop(taskID) for taskID in expired]
+        for (node, cb, arg, done), t, key, execution in expired:
+            if not node.claimExecution(execution):
+                # The node was cancelled meanwhile.
+                continue
+            logger.info('Peer did not return node {}. Executing it locally.'.format(node))
+            node.runLock.release()
+            if node.graph.executor:
+                node.graph.executor.submit(node, cb, arg, done, priority=node.graph.priorities.get(node.ID, 0))
+            else:
+                from floppy.graph import NodeThread
+                NodeThread(node, cb, arg, done)
+
+    def _updateSessions(self):
+        with self.sessionLock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            self.pools.assign(session.executionThread, session.executionThread.mode)
+
+    def configure(self, options, sessionID=''):
+        """
+        Applies interpreter options. Options concerning the shared worker pools and caches affect all sessions, the
+        frame rate, execution mode and pipeline depth only affect the given session.
+        :param options: dictionary.
+        :param sessionID: str
+        :return:
+        """
+        try:
+            workers = options['workers']
+        except KeyError:
+            pass
+        else:
+            self.setWorkers(workers)
+
+        try:
+            processes = options['processes']
+        except KeyError:
+            pass
+        else:
+            self.setProcesses(processes)
+
+        try:
+            cacheSize = options['cacheSize']
+        except KeyError:
+            pass
+        else:
+            floppy.cache.RESULTCACHE.resize(cacheSize)
+
+        try:
+            diskCacheSize = options['diskCacheSize']
+        except KeyError:
+            pass
+        else:
+            floppy.cache.DISKCACHE.resize(diskCacheSize*1024*1024)
+
+        try:
+            subGraphPoolSize = options['subGraphPoolSize']
+        except KeyError:
+            pass
+        else:
+            floppy.cache.SUBGRAPHS.resize(subGraphPoolSize)
+
+        try:
+            workDir = options['workDir']
+        except KeyError:
+            pass
+        else:
+            floppy.cache.DISKCACHE.setRoot(os.path.join(workDir, 'floppyCache') if workDir else None)
+
+        try:
+            peers = options['peers']
+        except KeyError:
+            pass
+        else:
+            from floppy.coordinator import parseAddress
+            self.peers = [parseAddress(peer) for peer in peers]
+
+        try:
+            self.lendTimeout = options['lendTimeout']
+        except KeyError:
+            pass
+
+        session = self.getSession(sessionID)
+        if session:
+            session.configure(options)
+
+
+class Session(object):
+    """
+    Graph hosted by a Runner together with its own ExecutionThread and scheduler state.
+    """
+    def __init__(self, runner, sessionID=''):
+        logger.info('Creating new session \'{}\'.'.format(sessionID))
+        self.runner = runner
+        self.sessionID = sessionID
         self.status = []
         self.runningNodes = []
-        self.conn = None
         self.nextNodePointer = None
         self.currentNodePointer = None
         self.lastNodePointer = None
         self.graphData = {}
         self.cmdQueue = Queue(1)
-        self.listener = Listener(self)
         self.executionThread = ExecutionThread(self.cmdQueue, self)
+        runner.pools.assign(self.executionThread, self.executionThread.mode)
 
         # self.updateSocket = socket(AF_INET, SOCK_STREAM)
         # self.updateSocket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
@@ -57,9 +405,6 @@ class Runner(object):
 
     # def __del__(self):
     #     self.updateSocket.close()
-    def join(self):
-        self.executionThread.join()
-
     def resetPointers(self):
         self.nextNodePointer = None
         self.currentNodePointer = None
@@ -80,32 +425,35 @@ class Runner(object):
     #         data += packet
     #     return data
 
-    def loadGraph(self, data):
-        data = json.loads(data)
-
-        self.graphData = data
+    def _queueCommand(self, cmd):
+        """
+        Replaces the pending command of the execution thread and wakes the thread up if it is paused. Without waking it
+        up a paused thread would only look at the queue again after a second and a quickly following command, e.g.
+        UNPAUSE right after PUSH, would replace the pending one before it was executed.
+        :param cmd: unbound ExecutionThread method.
+        :return:
+        """
         xLock.acquire()
         if not self.cmdQueue.empty():
             self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.loadGraph)
+        self.cmdQueue.put(cmd)
         xLock.release()
+        self.executionThread.wakeUp.set()
+
+    def loadGraph(self, data):
+        data = json.loads(data)
+
+        self.graphData = data
+        self._queueCommand(ExecutionThread.loadGraph)
 
     def updateGraph(self, data):
         data = json.loads(data)
 
         self.graphData = data
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.updateGraph)
-        xLock.release()
+        self._queueCommand(ExecutionThread.updateGraph)
 
     def pause(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.pause)
-        xLock.release()
+        self._queueCommand(ExecutionThread.pause)
 
     def drop(self):
         self.pause()
@@ -113,11 +461,7 @@ class Runner(object):
 
     def kill(self):
         # self.updateSocket.close()
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.kill)
-        xLock.release()
+        self._queueCommand(ExecutionThread.kill)
 
     def configure(self, options):
         # print(options)
@@ -133,24 +477,24 @@ class Runner(object):
         except KeyError:
             pass
         else:
+            self.runner.pools.assign(self.executionThread, mode)
             self.executionThread.setMode(mode)
 
+        try:
+            pipelineDepth = options['pipelineDepth']
+        except KeyError:
+            pass
+        else:
+            self.executionThread.setPipelineDepth(pipelineDepth)
+
     def unpause(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.unpause)
-        xLock.release()
+        self._queueCommand(ExecutionThread.unpause)
 
     def goto(self, nextID):
         self.nextNodePointer = nextID
 
     def step(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.step)
-        xLock.release()
+        self._queueCommand(ExecutionThread.step)
 
     def updateStatus(self, ID):
         nodeID = ID
@@ -161,11 +505,45 @@ class Runner(object):
 
     def getStatus(self):
         # string = '#'.join([str(i) for i in self.status])
+        graph = self.executionThread.graph
+        cancelled = []
+        if graph:
+            cancelled, graph.cancelledNodes = graph.cancelledNodes, []
         state = {'ran': self.status,
-                            'running': self.runningNodes}
+                            'running': self.runningNodes,
+                            'cancelled': cancelled,
+                            'cache': floppy.cache.RESULTCACHE.stats(),
+                            'diskCache': floppy.cache.DISKCACHE.stats(),
+                            'subGraphs': floppy.cache.SUBGRAPHS.stats()}
         self.status = []
         return state
 
+    def setInput(self, data):
+        """
+        Sets an input of a node of the session's graph to a value sent by another interpreter.
+        :param data: JSON string of a dictionary with the keys 'node', 'input', 'value' and 'loopLevel'. The value is
+        encoded with encodeValue().
+        :return: True if the input was set, False if the graph has no such node.
+        """
+        data = json.loads(data)
+        graph = self.executionThread.graph
+        if not graph or data['node'] not in graph.nodes:
+            return False
+        graph.nodes[data['node']].setInput(data['input'], decodeValue(data['value']), override=True,
+                                           loopLevel=data.get('loopLevel', 0))
+        return True
+
+    def cancelNode(self, nodeID):
+        """
+        Cancels a queued or running node of the session's graph.
+        :param nodeID: int
+        :return: True if the node was cancelled.
+        """
+        graph = self.executionThread.graph
+        if not graph or nodeID not in graph.nodes:
+            return False
+        return graph.cancelNode(graph.nodes[nodeID])
+
     def getReport(self, nodeID):
         if self.executionThread.graph and nodeID in self.executionThread.graph.nodes:
             report = self.executionThread.graph.nodes[nodeID].report()
@@ -180,9 +558,16 @@ class ExecutionThread(Thread):
         logger.debug('Creating new ExecutionThread.')
         self.graph = None
         self.framerate = 0.1
+        self.mode = 'Parallel'
+        self.plan = None
+        self.planLevel = 0
+        self.executor = None
+        self.processPool = None
+        self.pipelineDepth = 0
         self.master = master
         self.paused = True
         self.alive = True
+        self.wakeUp = Event()
         self._executeGraphStep = self.executeGraphStepPar
         self.cmdQueue = cmdQueue
         super(ExecutionThread, self).__init__()
@@ -194,11 +579,57 @@ class ExecutionThread(Thread):
         self.framerate = framerate
         logger.info('Framerate set to {}'.format(framerate))
 
+    def setPipelineDepth(self, depth):
+        """
+        Sets the number of values each input of the graph can hold. See Graph.pipeline().
+        :param depth: int; 0 disables pipelining.
+        :return:
+        """
+        self.pipelineDepth = depth
+        if self.graph:
+            self.graph.pipeline(depth)
+        logger.info('Pipeline depth set to {}'.format(depth))
+
+    def setExecutors(self, executor, processPool=None):
+        """
+        Sets the worker pools used for executing nodes. The pools are owned by a WorkerPools instance, e.g. the one a
+        Runner shares between all of its sessions, and are not shut down by this thread.
+        :param executor: NodePool instance or None.
+        :param processPool: ProcessPool instance or None.
+        :return:
+        """
+        self.executor = executor
+        self.processPool = processPool
+        self._updateExecutor()
+
+    def _updateExecutor(self):
+        """
+        Assigns the executor matching the current mode and worker settings to the graph.
+        In 'Process' mode stateless nodes are executed by the ProcessPool, which passes all other nodes on to the thread
+        based executor.
+        :return:
+        """
+        if self.mode == 'Process' and self.processPool:
+            executor = self.processPool
+        else:
+            executor = self.executor
+        if self.graph:
+            self.graph.executor = executor
+
     def setMode(self, mode):
         if mode == 'Parallel':
             self._executeGraphStep = self.executeGraphStepPar
+        elif mode == 'Event':
+            self._executeGraphStep = self.executeGraphStepEvent
+        elif mode == 'Process':
+            self._executeGraphStep = self.executeGraphStepPar
+        elif mode == 'Static':
+            self._executeGraphStep = self.executeGraphStepStatic
         else:
             self._executeGraphStep = self.executeGraphStep
+        self.mode = mode
+        self._updateExecutor()
+        logger.info('Execution mode set to {}'.format(mode))
 
     def run(self):
         while self.alive:
@@ -212,7 +643,8 @@ class ExecutionThread(Thread):
                 cmd(self)
             if self.paused:
                 # print('Sleeping')
-                time.sleep(1)
+                self.wakeUp.wait(1)
+                self.wakeUp.clear()
                 continue
             if self.alive and self.graph:
                 if not self.graph.returnValue == -1:
@@ -240,6 +672,7 @@ class ExecutionThread(Thread):
     def kill(self):
         logger.info('Exiting')
         self.alive = False
+        self.wakeUp.set()
 
     def step(self):
         print('Stepping up.')
@@ -252,8 +685,12 @@ class ExecutionThread(Thread):
         from floppy.graph import Graph
         logger.debug('Attempting to load graph instance.')
         self.graph = Graph()
+        self._updateExecutor()
         # print(type(self.master.graph))
         self.graph.loadState(self.master.graphData, reuseIDs=True)
+        self.graph.pipeline(self.pipelineDepth)
+        self.graph.fuseChains()
+        self.compilePlan()
         logger.info('Successfully loaded graph instance.')
         #self.resetPointers()
 
@@ -263,9 +700,26 @@ class ExecutionThread(Thread):
         # print(type(self.master.graph))
         logger.debug('Attempting to update graph instance.')
         self.graph.updateState(self.master.graphData, reuseIDs=True)
+        logger.debug('{} of {} nodes need to be executed again.'.format(len(self.graph.dirtyNodes), len(self.graph.nodes)))
+        self.graph.readyQueue.pushAll(self.graph.dirtyNodes)
+        self.graph.pipeline(self.pipelineDepth)
+        self.graph.fuseChains()
+        self.compilePlan()
         logger.info('Successfully updated graph instance.')
         #self.resetPointers()
 
+    def compilePlan(self):
+        """
+        Compiles the static execution plan of the current graph. The plan is None if the graph contains control flow.
+        :return:
+        """
+        self.plan = self.graph.compileExecutionPlan()
+        self.planLevel = 0
+        if self.plan is None:
+            logger.debug('Graph is not acyclic. No static execution plan available.')
+        else:
+            logger.debug('Compiled static execution plan with {} levels.'.format(len(self.plan)))
+
     def executeGraphStep(self):
         if not self.graph:
             return
@@ -275,7 +729,7 @@ class ExecutionThread(Thread):
             self.master.nextNodePointer = None
             if nextNode.check():
                 with nextNode.runLock:
-                    nextNode.run()
+                    nextNode.runSync()
                     nextNode.notify()
                     self.master.sendStatus(nextNode.ID)
         else:
@@ -285,7 +739,7 @@ class ExecutionThread(Thread):
                 running = checked if not running else True
                 if checked:
                     with node.runLock:
-                        node.run()
+                        node.runSync()
                         # self.graph.runNodePar(node)
                         # raise RuntimeError('Uncaught exception while executing node {}.'.format(node))
                         node.notify()
@@ -304,25 +758,168 @@ class ExecutionThread(Thread):
             self.master.nextNodePointer = None
             if nextNode.check():
                 with nextNode.runLock:
-                    nextNode.run()
+                    nextNode.runSync()
                     nextNode.notify()
                 self.master.sendStatus(nextNode.ID)
         else:
             running = False
             readyNodes = []
             for node in self.graph.nodes.values():
+                if node.locked:
+                    # A pooled node may finish between check() and a later test of 'locked' and would then be
+                    # submitted again on a stale check. Locked nodes are only checked to keep the step awake.
+                    running = running or bool(node.check())
+                    continue
                 checked = node.check()
+                if checked and self.graph.isReserved(node):
+                    checked = False
+                if checked and not self.graph.acquireResources(node):
+                    checked = False
                 running = checked if not running else True
-                if checked and not node.locked:
+                if checked:
                     node.lock()
                     readyNodes.append(node)
             # print([str(node) for node in readyNodes])
+            self.graph.sortByPriority(readyNodes)
             for node in readyNodes:
                 self.graph.runNodePar(node, cb=self.master.updateStatus, arg=node.ID)
             if not running:
                 # print('Nothing to do here @ {}'.format(time.time()))
                 time.sleep(self.framerate)
 
+    def executeGraphStepStatic(self):
+        """
+        Executes the next level of the graph's static execution plan as one batch.
+        Every node is checked exactly once before its level is executed. Nodes that are not ready, e.g. because a
+        predecessor failed, are skipped. Nodes waiting for a resource are executed in additional batches.
+        Once all levels were executed or if the graph has no static plan, executeGraphStepPar takes over.
+        :return:
+        """
+        if self.master.nextNodePointer or not self.plan or self.planLevel >= len(self.plan):
+            return self.executeGraphStepPar()
+        pendingNodes = [node for node in self.plan[self.planLevel]
+                        if not node.locked and node.check() and not self.graph.isReserved(node)]
+        self.planLevel += 1
+        self.graph.sortByPriority(pendingNodes)
+        while pendingNodes:
+            readyNodes = [node for node in pendingNodes if self.graph.acquireResources(node)]
+            pendingNodes = [node for node in pendingNodes if node not in readyNodes]
+            if not readyNodes:
+                time.sleep(self.framerate)
+                continue
+            for node in readyNodes:
+                node.lock()
+            self.graph.runBatch(readyNodes, cb=self.master.updateStatus)
+
+    def executeGraphStepEvent(self):
+        """
+        Event driven version of executeGraphStepPar.
+        Instead of checking every node of the graph only the nodes in the graph's ready queue are checked. Nodes are
+        pushed onto that queue when one of their inputs is set or when they finished running. Nodes flagged as 'polled'
+        are checked on every step.
+        If no node is ready the method blocks until a node is pushed or one framerate has passed.
+        :return:
+        """
+        if self.master.nextNodePointer:
+            nextNode = self.graph.nodes[self.master.nextNodePointer]
+            self.master.nextNodePointer = None
+            if nextNode.check():
+                with nextNode.runLock:
+                    nextNode.runSync()
+                    nextNode.notify()
+                self.master.sendStatus(nextNode.ID)
+        else:
+            readyNodes = []
+            for node in self.graph.readyQueue.pop() + self.graph.polledNodes:
+                if not node.locked and node.check() and not self.graph.isReserved(node) and \
+                        self.graph.acquireResources(node):
+                    node.lock()
+                    readyNodes.append(node)
+            self.graph.sortByPriority(readyNodes)
+            for node in readyNodes:
+                self.graph.runNodePar(node, cb=self.master.updateStatus, arg=node.ID)
+            if not readyNodes:
+                self.graph.readyQueue.wait(self.framerate)
+
+
+
+class WorkStealer(Thread):
+    """
+    Thread taking queued stateless nodes from busy peers while the interpreter's own workers are idle.
+    The peers are asked for their load with the LOAD command and the busiest peer is asked for a node with the STEAL
+    command. The node is executed with runDetached() and the result is sent back with the RESULT command.
+    """
+    def __init__(self, master, interval=.2):
+        super(WorkStealer, self).__init__()
+        self.master = master
+        self.interval = interval
+        self.alive = True
+        self.running = 0
+        self.runningLock = Lock()
+        self.daemon = True
+        self.start()
+
+    def kill(self):
+        self.alive = False
+
+    def run(self):
+        while self.alive:
+            time.sleep(self.interval)
+            self.master.reclaimNodes()
+            if not self.master.peers:
+                continue
+            while self.alive and self.running < self.master.getCapacity():
+                if not self.steal():
+                    break
+
+    def steal(self):
+        """
+        Takes one node from the busiest peer and starts executing it.
+        :return: True if a node was taken.
+        """
+        from floppy.coordinator import getLink, dropLink
+        loads = []
+        for peer in self.master.peers:
+            try:
+                load = json.loads(getLink(*peer).send('LOAD'))
+            except OSError:
+                dropLink(*peer)
+                continue
+            except (ValueError, TypeError):
+                continue
+            if load['queued']:
+                loads.append((load['queued'], peer))
+        for queued, peer in sorted(loads, reverse=True):
+            try:
+                task = json.loads(getLink(*peer).send('STEAL'))
+            except OSError:
+                dropLink(*peer)
+                continue
+            except (ValueError, TypeError):
+                continue
+            if task:
+                with self.runningLock:
+                    self.running += 1
+                Thread(target=self.execute, args=(peer, task), daemon=True).start()
+                return True
+        return False
+
+    def execute(self, peer, task):
+        from floppy.graph import runDetached
+        from floppy.coordinator import getLink, dropLink
+        logger.debug('Executing node of class {} for peer {}:{}.'.format(task['class'], *peer))
+        try:
+            result = {'task': task['task'], 'outputs': encodeValue(runDetached(task['class'],
+                                                                               decodeValue(task['inputs'])))}
+        except Exception as e:
+            result = {'task': task['task'], 'error': str(e)}
+        try:
+            getLink(*peer).send('RESULT' + json.dumps(result))
+        except OSError as e:
+            dropLink(*peer)
+            logger.warning('Cannot return result to peer {}:{}: {}'.format(peer[0], peer[1], e))
+        with self.runningLock:
+            self.running -= 1
 
 
 class Listener(Thread):
@@ -378,7 +975,12 @@ class CommandProcessor(Thread):
             message = self.receive()
             if message:
                 # logger.debug('Received command: {}...'.format(message[:10]))
-                if message == 'KILL':
+                # Commands can be addressed to a session by prefixing them with '@<sessionID> '.
+                sessionID = ''
+                if message.startswith('@'):
+                    sessionID, _, message = message[1:].partition(' ')
+                session = self.master.getSession(sessionID, create=message.startswith(('PUSH', 'PAUSE', 'CONFIGURE')))
+                if message == 'KILL' and not sessionID:
                     # print('Killing myself')
                     self.send('Runner is terminating.')
                     self.listener.kill()
@@ -386,43 +988,70 @@ class CommandProcessor(Thread):
                     return
                 elif message == 'READY?':
                     self.send('READY')
+                elif message == 'SESSIONS':
+                    self.send(json.dumps(self.master.getSessions()))
+                elif message == 'LOAD':
+                    self.send(json.dumps(self.master.getLoad()))
+                elif message == 'STEAL':
+                    self.send(json.dumps(self.master.lendNode()))
+                elif message.startswith('RESULT'):
+                    if self.master.acceptResult(message[6:]):
+                        self.send('Result accepted.')
+                    else:
+                        self.send('Result rejected. Unknown task.')
+                elif not session:
+                    self.send('Session \'{}\' does not exist.'.format(sessionID))
+                elif message == 'KILL':
+                    self.send('Session \'{}\' is terminating.'.format(sessionID))
+                    self.master.closeSession(sessionID)
                 elif message == 'PAUSE':
                     self.send('Runner is pausing.')
-                    self.master.pause()
+                    session.pause()
                 elif message == 'UNPAUSE':
                     self.send('Runner is unpausing.')
-                    self.master.unpause()
+                    session.unpause()
                 elif message.startswith('UPDATE'):
                     self.send('Runner is updating.')
-                    self.master.updateGraph(message[6:])
+                    session.updateGraph(message[6:])
                 elif message.startswith('PUSH'):
                     self.send('Accepted pushed Graph. Runner is updating.')
-                    self.master.loadGraph(message[4:])
+                    session.loadGraph(message[4:])
                 elif message.startswith('DROP'):
                     self.send('Runner is dropping current graph.')
-                    self.master.drop()
+                    session.drop()
                 elif message.startswith('GOTO'):
                     nextID = int(message[4:])
                     self.send('Runner jumping to node {}.'.format(nextID))
-                    self.master.goto(nextID)
+                    session.goto(nextID)
                 elif message.startswith('CONFIGURE'):
                     msg = message[9:]
                     self.send('Configuration accepted.')
-                    self.master.configure(json.loads(msg))
+                    self.master.configure(json.loads(msg), sessionID)
+                elif message.startswith('SETINPUT'):
+                    if session.setInput(message[8:]):
+                        self.send('Input set.')
+                    else:
+                        self.send('Cannot set input. Node not found.')
+                elif message.startswith('CANCEL'):
+                    nodeID = int(message[6:])
+                    if session.cancelNode(nodeID):
+                        self.send('Node {} cancelled.'.format(nodeID))
+                    else:
+                        self.send('Node {} is neither queued nor running.'.format(nodeID))
                 elif message == 'STEP':
                     self.send('Runner is performing one step.')
-                    self.master.step()
+                    session.step()
                 elif message.startswith('STATUS'):
-                    if self.master.executionThread.graph:
-                        if not self.master.executionThread.graph.returnValue == -1:
+                    if session.executionThread.graph:
+                        if not session.executionThread.graph.returnValue == -1:
 
-                            self.send(json.dumps({'STATUS': 'RETURN', 'REPORT': (self.master.executionThread.graph.returnValue, self.master.executionThread.graph.returningNode)}))
+                            self.send(json.dumps({'STATUS': 'RETURN', 'REPORT': (session.executionThread.graph.returnValue, session.executionThread.graph.returningNode)}))
                             continue
                     reportNode = message.split('***')[-1]
                     report = ''
                     if reportNode:
-                        report = self.master.getReport(int(reportNode))
-                    status = self.master.getStatus()
+                        report = session.getReport(int(reportNode))
+                    status = session.getStatus()
                     self.send(json.dumps({'STATUS': status, 'REPORT': report}))
                 else:
                     self.send('Command \'{}...\' not understood.'.format(message[:50]))
@@ -564,9 +1193,29 @@ def sendCommand(cmd, host, port):
     clientSocket.close()
 
 
-def spawnRunner(listenPort):
-    global port
-    port = listenPort
+def encodeValue(value):
+    """
+    Encodes an arbitrary picklable object as a string that can be embedded into a JSON command.
+    :param value: object.
+    :return: str
+    """
+    return base64.b64encode(pickle.dumps(value)).decode('ascii')
+
+
+def decodeValue(string):
+    """
+    Restores an object encoded with encodeValue().
+    :param string: str
+    :return: object.
+    """
+    return pickle.loads(base64.b64decode(string))
+
+
+def loadCustomNodes():
+    """
+    Imports all modules in the CustomNodes directory to make their node classes available to the interpreter.
+    :return:
+    """
     import os
     from importlib.machinery import SourceFileLoader
     customNodesPath = os.path.join(os.path.realpath(__file__)[:-10], 'CustomNodes')
@@ -576,6 +1225,12 @@ def spawnRunner(listenPort):
                 SourceFileLoader(str(i), os.path.join(customNodesPath, path)).load_module()
             except Exception as e:
                 print('Warning: error in custom node:\n{}'.format(str(e)))
+
+
+def spawnRunner(listenPort):
+    global port
+    port = listenPort
+    loadCustomNodes()
     r = Runner()
     print('Remote Graph Interpreter Initialized.'
           'Listening on port {}'.format(port))